@@ -1,12 +1,8 @@
 from flask import Flask
 from .models import db, login_manager
-from flask_bootstrap import Bootstrap
 from config import Config
-from flask_cors import CORS
-from app.api import api
 # from flask_migrate import Migrate
 
-cors = CORS()
 # migrate = Migrate()
 
 login_manager.login_view = 'auth.login'
@@ -15,8 +11,16 @@ login_manager.login_message_category = 'info'
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # Imported here so that importing the package (models, CLI helpers) stays cheap
+    from flask_bootstrap import Bootstrap
+    from flask_cors import CORS
+    from app.api import api
     CORS(app)
 
+    if app.config.get('REPLICA_DATABASE_URL'):
+        from app.replica import REPLICA_BIND
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                              **{REPLICA_BIND: app.config['REPLICA_DATABASE_URL']})
     db.init_app(app)
     api.init_app(app)
     # migrate.init_app(app, db)
@@ -32,23 +36,31 @@ def create_app(config_class=Config):
     app.register_blueprint(user)
 
     # Register error handlers
-    from app.utils import page_not_found, forbidden, server_error
+    from app.utils import page_not_found, forbidden, server_error, hashing_busy
+    from app.passwords import HashPoolBusy, init_passwords
     app.register_error_handler(404, page_not_found)
     app.register_error_handler(403, forbidden)
     app.register_error_handler(500, server_error)
+    app.register_error_handler(HashPoolBusy, hashing_busy)
+    init_passwords(app)
+    from app.principal import init_principals
+    init_principals(app)
+    from app.fragments import init_fragments
+    init_fragments(app)
+
+    from app.commands import register_commands
+    register_commands(app)
 
     with app.app_context():
-        db.create_all()
-        # Create default quizmaster if not exists
-        from app.models import User
-        quizmaster = User.query.filter_by(username=app.config['QUIZMASTER_USERNAME']).first()
-        if not quizmaster:
-            quizmaster = User(
-                username=app.config['QUIZMASTER_USERNAME'],
-                is_admin=True
-            )
-            quizmaster.set_password(app.config['QUIZMASTER_PASSWORD'])
-            db.session.add(quizmaster)
-            db.session.commit()
+        from app.database import configure_engine
+        configure_engine(app, db)
+        from app.replica import init_replica
+        init_replica(app, db)
+        from app.instrumentation import init_instrumentation
+        init_instrumentation(app, db)
+        # Pre-forked production servers turn this off and run `flask init-db` once per deploy
+        if app.config['INIT_DB_ON_STARTUP']:
+            from app.schema import initialize
+            initialize()
 
     return app
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, IntegerField, SelectField, SubmitField, DateTimeField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, TextAreaField, IntegerField, SelectField, SubmitField, DateTimeField, BooleanField
 from wtforms.validators import DataRequired, Length, NumberRange, Optional, Email
 from app.models import Chapter, Subject
 class SubjectForm(FlaskForm):
@@ -25,6 +26,7 @@ class QuizForm(FlaskForm):
     passing_score = IntegerField('Passing Score (%)', validators=[DataRequired(), NumberRange(min=0, max=100)], default=70)
     deadline = DateTimeField('Deadline (Optional)', format='%Y-%m-%d %H:%M', validators=[Optional()])
     prerequisite_quiz_id = SelectField('Prerequisite Quiz', coerce=int, validators=[Optional()], choices=[], validate_choice=False)
+    full_paper = BooleanField('Full Paper Mode')
     submit = SubmitField('Save')
 
     def __init__(self, *args, **kwargs):
@@ -52,6 +54,13 @@ class QuestionForm(FlaskForm):
                                validators=[DataRequired()])
     submit = SubmitField('Save')
 
+class QuestionImportForm(FlaskForm):
+    file = FileField('Question File (CSV or JSONL)', validators=[
+        FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson'], 'Upload a .csv or .jsonl file')
+    ])
+    dry_run = BooleanField('Validate only (do not import)')
+    submit = SubmitField('Import')
+
 class ChapterForm(FlaskForm):
     name = StringField('Chapter Name', validators=[DataRequired(), Length(max=100)])
     description = TextAreaField('Description')
@@ -1,9 +1,14 @@
-from flask import render_template, url_for, flash, redirect, request, abort
+from flask import render_template, url_for, flash, redirect, request, abort, Response, stream_with_context, current_app
 from flask_login import current_user, login_required
 from app import db
-from app.models import Subject, Quiz, Question, User, QuizAttempt, UserAnswer, Chapter, Teacher
-from app.admin.forms import SubjectForm, QuizForm, QuestionForm, ChapterForm, TeacherForm
+from app.models import Subject, Quiz, Question, User, QuizAttempt, UserAnswer, Chapter, Teacher, SubjectStats, QuizStats, UserSubjectStats
+from app.admin.forms import SubjectForm, QuizForm, QuestionForm, QuestionImportForm, ChapterForm, TeacherForm
 from app.utils import calculate_score
+from app.snapshots import invalidate_quiz_snapshot, discard_quiz_snapshot
+from app import stats, search, counters, imports, exports, jobs
+from app.pagination import encode_cursor, decode_cursor, keyset_filter, keyset_order
+from app.replica import read_replica
+from app.principal import invalidate_principal
 from sqlalchemy import func
 from datetime import datetime
 from . import admin
@@ -23,11 +28,18 @@ def dashboard():
     elif request.method == 'GET':
         search_query = request.args.get('q', '')
     
+    page = max(request.args.get('page', 1, type=int), 1)
+    hits, has_next = [], False
     if search_query:
-        subjects = Subject.query.filter(Subject.name.ilike(f'%{search_query}%')).all()
+        # Ranked full-text hits; the subjects they belong to are shown in rank order
+        hits, has_next = search.search(search_query, kinds=search.ALL_KINDS, page=page)
+        subject_ids = list(dict.fromkeys(hit.subject_id for hit in hits))
+        subjects_by_id = {subject.id: subject for subject in Subject.query.filter(Subject.id.in_(subject_ids))}
+        subjects = [subjects_by_id[subject_id] for subject_id in subject_ids if subject_id in subjects_by_id]
     else:
-        subjects = Subject.query.all()
-    return render_template('admin/dashboard.html', subjects=subjects, search_query=search_query)
+        subjects = Subject.query.options(db.selectinload(Subject.quizzes)).all()
+    return render_template('admin/dashboard.html', subjects=subjects, search_query=search_query,
+                         hits=hits, page=page, has_next=has_next)
 
 @admin.route('/subject/add', methods=['GET', 'POST'])
 def add_subject():
@@ -36,6 +48,10 @@ def add_subject():
         teacher_id = form.teacher_id.data if form.teacher_id.data != 0 else None
         subject = Subject(name=form.name.data, description=form.description.data, teacher_id=teacher_id)
         db.session.add(subject)
+        db.session.flush()
+        counters.bump(Teacher, teacher_id, 'subject_count')
+        stats.create_rollups(subject_id=subject.id)
+        search.index('subject', subject)
         db.session.commit()
         flash('Subject added successfully!', 'success')
         return redirect(url_for('admin.dashboard'))
@@ -48,7 +64,12 @@ def edit_subject(subject_id):
     if form.validate_on_submit():
         subject.name = form.name.data
         subject.description = form.description.data
-        subject.teacher_id = form.teacher_id.data if form.teacher_id.data != 0 else None
+        teacher_id = form.teacher_id.data if form.teacher_id.data != 0 else None
+        if teacher_id != subject.teacher_id:
+            counters.bump(Teacher, subject.teacher_id, 'subject_count', -1)
+            counters.bump(Teacher, teacher_id, 'subject_count')
+        subject.teacher_id = teacher_id
+        search.index('subject', subject)
         db.session.commit()
         flash('Subject updated successfully!', 'success')
         return redirect(url_for('admin.dashboard'))
@@ -69,9 +90,12 @@ def view_subject(subject_id):
 @admin.route('/subject/<int:subject_id>/delete', methods=['POST'])
 def delete_subject(subject_id):
     subject = Subject.query.get_or_404(subject_id)
-    db.session.delete(subject)
+    queued = jobs.enqueue('delete_subject', subject_id=subject.id)
     db.session.commit()
-    flash('Subject deleted successfully!', 'success')
+    if queued:
+        flash('Subject deletion queued; it will disappear shortly.', 'info')
+    else:
+        flash('Subject deleted successfully!', 'success')
     return redirect(url_for('admin.dashboard'))
 
 @admin.route('/quiz/<int:subject_id>/add', methods=['GET', 'POST'])
@@ -98,9 +122,15 @@ def add_quiz(subject_id):
             max_attempts=form.max_attempts.data,
             passing_score=form.passing_score.data,
             deadline=form.deadline.data,
-            prerequisite_quiz_id=form.prerequisite_quiz_id.data if form.prerequisite_quiz_id.data != 0 else None
+            prerequisite_quiz_id=form.prerequisite_quiz_id.data if form.prerequisite_quiz_id.data != 0 else None,
+            full_paper=form.full_paper.data
         )
         db.session.add(quiz)
+        db.session.flush()
+        stats.create_rollups(quiz=quiz)
+        search.index('quiz', quiz)
+        counters.bump(Subject, quiz.subject_id, 'quiz_count')
+        counters.bump(Chapter, quiz.chapter_id, 'quiz_count')
         db.session.commit()
         flash('Quiz added successfully!', 'success')
         return redirect(url_for('admin.view_subject', subject_id=subject.id))
@@ -121,12 +151,18 @@ def edit_quiz(quiz_id):
         quiz.name = form.name.data
         quiz.description = form.description.data
         quiz.time_limit = form.time_limit.data
-        quiz.chapter_id = form.chapter_id.data if form.chapter_id.data != 0 else None
+        chapter_id = form.chapter_id.data if form.chapter_id.data != 0 else None
+        if chapter_id != quiz.chapter_id:
+            counters.bump(Chapter, quiz.chapter_id, 'quiz_count', -1)
+            counters.bump(Chapter, chapter_id, 'quiz_count')
+        quiz.chapter_id = chapter_id
         quiz.sequence_number = form.sequence_number.data
         quiz.max_attempts = form.max_attempts.data
         quiz.passing_score = form.passing_score.data
         quiz.deadline = form.deadline.data
         quiz.prerequisite_quiz_id = form.prerequisite_quiz_id.data if form.prerequisite_quiz_id.data != 0 else None
+        quiz.full_paper = form.full_paper.data
+        search.index('quiz', quiz)
         db.session.commit()
         flash('Quiz updated successfully!', 'success')
         return redirect(url_for('admin.view_subject', subject_id=quiz.subject_id))
@@ -140,6 +176,7 @@ def edit_quiz(quiz_id):
         form.passing_score.data = quiz.passing_score
         form.deadline.data = quiz.deadline
         form.prerequisite_quiz_id.data = quiz.prerequisite_quiz_id or 0
+        form.full_paper.data = quiz.full_paper
     return render_template('admin/edit_quiz.html', form=form, quiz=quiz)
 
 @admin.route('/quiz/<int:quiz_id>/view')
@@ -151,8 +188,14 @@ def view_quiz(quiz_id):
 def delete_quiz(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     subject_id = quiz.subject_id
+    stats.discard_quizzes([quiz])
+    search.remove_quiz(quiz.id)
+    counters.bump(Subject, quiz.subject_id, 'quiz_count', -1)
+    counters.bump(Chapter, quiz.chapter_id, 'quiz_count', -1)
+    counters.discount_attempts(QuizAttempt.quiz_id == quiz.id)
     db.session.delete(quiz)
     db.session.commit()
+    discard_quiz_snapshot(quiz_id)
     flash('Quiz deleted successfully!', 'success')
     return redirect(url_for('admin.view_subject', subject_id=subject_id))
 
@@ -172,11 +215,35 @@ def add_question(quiz_id):
             quiz_id=quiz.id
         )
         db.session.add(question)
+        db.session.flush()
+        search.index('question', question)
+        counters.bump(Quiz, quiz.id, 'question_count')
+        invalidate_quiz_snapshot(quiz)
         db.session.commit()
         flash('Question added successfully!', 'success')
         return redirect(url_for('admin.view_quiz', quiz_id=quiz.id))
     return render_template('admin/add_question.html', form=form, quiz=quiz)
 
+@admin.route('/quiz/<int:quiz_id>/import-questions', methods=['GET', 'POST'])
+def import_questions(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    form = QuestionImportForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        fmt = 'csv' if upload.filename.lower().endswith('.csv') else 'jsonl'
+        try:
+            result = imports.import_questions(quiz, upload.stream, fmt, dry_run=form.dry_run.data)
+        except ValueError as e:
+            flash(str(e), 'danger')
+        else:
+            if result.aborted:
+                flash(result.aborted, 'danger')
+            verb = 'would be imported' if result.dry_run else 'imported'
+            flash(f'{result.imported} question(s) {verb}, {result.rejected} row(s) rejected.',
+                  'success' if not result.rejected else 'warning')
+    return render_template('admin/import_questions.html', form=form, quiz=quiz, result=result)
+
 @admin.route('/question/<int:question_id>/edit', methods=['GET', 'POST'])
 def edit_question(question_id):
     question = Question.query.get_or_404(question_id)
@@ -189,6 +256,8 @@ def edit_question(question_id):
         question.option3 = form.option3.data
         question.option4 = form.option4.data
         question.correct_option = form.correct_option.data
+        search.index('question', question)
+        invalidate_quiz_snapshot(question.quiz)
         db.session.commit()
         flash('Question updated successfully!', 'success')
         return redirect(url_for('admin.view_quiz', quiz_id=question.quiz_id))
@@ -206,6 +275,9 @@ def edit_question(question_id):
 def delete_question(question_id):
     question = Question.query.get_or_404(question_id)
     quiz_id = question.quiz_id
+    invalidate_quiz_snapshot(question.quiz)
+    search.remove('question', question.id)
+    counters.bump(Quiz, quiz_id, 'question_count', -1)
     db.session.delete(question)
     db.session.commit()
     flash('Question deleted successfully!', 'success')
@@ -214,37 +286,34 @@ def delete_question(question_id):
 from sqlalchemy import func
 
 @admin.route('/statistics')
+@read_replica
 def statistics():
-    # Basic counts
-    user_count = User.query.filter_by(is_admin=False).count()
-    subject_count = Subject.query.count()
-    quiz_count = Quiz.query.count()
-    question_count = Question.query.count()
+    # Basic counts (from the totals and counter caches, not the big tables)
+    user_count = counters.total('students')
+    subject_count, quiz_count = db.session.query(
+        func.count(Subject.id), func.coalesce(func.sum(Subject.quiz_count), 0)
+    ).one()
+    question_count = db.session.query(func.coalesce(func.sum(Quiz.question_count), 0)).scalar()
     
-    # Subject-wise average scores
-    subject_stats = db.session.query(
-        Subject.name,
-        func.avg(QuizAttempt.score).label('average_score')
-    ).join(Quiz, Quiz.subject_id == Subject.id
-    ).join(QuizAttempt, QuizAttempt.quiz_id == Quiz.id
-    ).group_by(Subject.name).all()
+    # Subject-wise average scores (from the rollup table)
+    subject_stats = db.session.query(Subject.name, SubjectStats
+    ).join(SubjectStats, SubjectStats.subject_id == Subject.id
+    ).filter(SubjectStats.attempt_count > 0
+    ).order_by(Subject.name).all()
     
     # Prepare chart data
-    subject_names = [stat.name for stat in subject_stats]
-    subject_scores = [float(stat.average_score or 0) for stat in subject_stats]
+    subject_names = [name for name, _ in subject_stats]
+    subject_scores = [rollup.average_score for _, rollup in subject_stats]
     
-    # Top 10 quizzes by attempts
-    popular_quizzes = db.session.query(
-        Quiz.name,
-        func.count(QuizAttempt.id).label('attempt_count'),
-        func.avg(QuizAttempt.score).label('average_score')
-    ).join(QuizAttempt, QuizAttempt.quiz_id == Quiz.id
-    ).group_by(Quiz.name
-    ).order_by(func.count(QuizAttempt.id).desc()
+    # Top 10 quizzes by attempts (from the rollup table, one row per quiz)
+    popular_quizzes = db.session.query(Quiz.name, QuizStats
+    ).join(QuizStats, QuizStats.quiz_id == Quiz.id
+    ).filter(QuizStats.attempt_count > 0
+    ).order_by(QuizStats.attempt_count.desc()
     ).limit(10).all()
     
-    quiz_names = [quiz.name for quiz in popular_quizzes]
-    quiz_scores = [float(quiz.average_score or 0) for quiz in popular_quizzes]
+    quiz_names = [name for name, _ in popular_quizzes]
+    quiz_scores = [rollup.average_score for _, rollup in popular_quizzes]
     
     return render_template('admin/statistics.html',
                          user_count=user_count,
@@ -256,45 +325,121 @@ def statistics():
                          quiz_names=quiz_names,
                          quiz_scores=quiz_scores)
 
+@admin.route('/export/<dataset>.<fmt>')
+def export_data(dataset, fmt):
+    """Stream attempts or answers as CSV/NDJSON, filtered by the query string"""
+    if dataset not in exports.EXPORT_DATASETS or fmt not in exports.EXPORT_FORMATS:
+        abort(404)
+    try:
+        filters = exports.parse_filters(**{
+            name: request.args.get(name) for name in ('subject_id', 'quiz_id', 'user_id', 'since', 'until')
+        })
+    except ValueError as e:
+        abort(400, str(e))
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(exports.export_rows(dataset, fmt, **filters)),
+        mimetype=exports.EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @admin.route('/user-statistics/<int:user_id>')
+@read_replica
 def view_user_statistics(user_id):
     user = User.query.get_or_404(user_id)
     
-    # User's performance by subject
-    subject_stats = db.session.query(
-        Subject.name,
-        func.avg(QuizAttempt.score).label('average_score')
-    ).join(Quiz, Quiz.subject_id == Subject.id
-    ).join(QuizAttempt, QuizAttempt.quiz_id == Quiz.id
-    ).filter(QuizAttempt.user_id == user.id
-    ).group_by(Subject.name).all()
+    page = request.args.get('page', 1, type=int)
+    
+    # User's performance by subject (from the per-user rollups)
+    subject_stats = stats.user_subject_stats(user.id)
     
     # Prepare chart data
     subject_names = [stat.name for stat in subject_stats]
     subject_scores = [float(stat.average_score or 0) for stat in subject_stats]
     
-    # User's quiz attempts
-    quiz_attempts = db.session.query(
-        Quiz.name,
-        Subject.name.label('subject_name'),
-        QuizAttempt.score,
-        QuizAttempt.completed_at
-    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id
-    ).join(Subject, Quiz.subject_id == Subject.id
-    ).filter(QuizAttempt.user_id == user.id
-    ).order_by(QuizAttempt.completed_at.desc()).all()
+    # One page of the user's quiz attempts
+    quiz_attempts, has_next = stats.user_attempts_page(user.id, max(page, 1))
     
     return render_template('admin/view_user_statistics.html',
                          user=user,
                          subject_stats=subject_stats,
                          quiz_attempts=quiz_attempts,
+                         page=max(page, 1),
+                         has_next=has_next,
                          subject_names=subject_names,
                          subject_scores=subject_scores)
 
+USERS_PER_PAGE = 50
+
 @admin.route('/user-statistics')
+@read_replica
 def user_statistics():
-    users = User.query.filter_by(is_admin=False).all()
-    return render_template('admin/user_statistics.html', users=users)
+    sort = request.args.get('sort', 'username')
+    if sort not in ('username', 'created_at', 'attempts', 'average'):
+        sort = 'username'
+    descending = request.args.get('order', 'asc' if sort == 'username' else 'desc') == 'desc'
+    prefix = request.args.get('q', '').strip()
+    cursor = decode_cursor(request.args.get('after'))
+
+    # Per-user average scores come from the rollup table; attempt counts come
+    # from the User.attempt_count counter cache
+    user_average = (func.sum(UserSubjectStats.score_sum)
+                    / func.nullif(func.sum(UserSubjectStats.completed_count), 0))
+
+    if sort == 'average':
+        # Sorting by the average needs it for every user, so aggregate them all
+        totals = db.session.query(
+            UserSubjectStats.user_id, user_average.label('average_score')
+        ).group_by(UserSubjectStats.user_id).subquery()
+        sort_column = func.coalesce(totals.c.average_score, 0.0)
+        query = db.session.query(User, User.attempt_count, sort_column
+        ).outerjoin(totals, totals.c.user_id == User.id)
+    else:
+        # The other sorts walk an index on user; averages are fetched for the page only
+        sort_column = {
+            'username': User.username,
+            'created_at': User.created_at,
+            'attempts': User.attempt_count
+        }[sort]
+        query = db.session.query(User, User.attempt_count, db.literal(None))
+    query = query.filter(User.is_admin == False)
+    if prefix:
+        # Range scan on the username index instead of LIKE
+        query = query.filter(User.username >= prefix, User.username < prefix + '\uffff')
+    if cursor and len(cursor) == 2:
+        sort_value, last_id = cursor
+        if sort == 'created_at':
+            try:
+                sort_value = datetime.fromisoformat(sort_value)
+            except (TypeError, ValueError):
+                abort(400)
+        query = query.filter(keyset_filter(sort_column, User.id, sort_value, last_id, descending))
+
+    rows = query.order_by(*keyset_order(sort_column, User.id, descending)).limit(USERS_PER_PAGE + 1).all()
+    if sort != 'average' and rows:
+        averages = dict(db.session.query(UserSubjectStats.user_id, user_average
+        ).filter(UserSubjectStats.user_id.in_([user.id for user, _, _ in rows])
+        ).group_by(UserSubjectStats.user_id).all())
+        rows = [(user, attempts, averages.get(user.id) or 0.0) for user, attempts, _ in rows]
+    next_cursor = None
+    if len(rows) > USERS_PER_PAGE:
+        rows = rows[:USERS_PER_PAGE]
+        last_user, last_attempts, last_average = rows[-1]
+        last_value = {
+            'username': last_user.username,
+            'created_at': last_user.created_at,
+            'attempts': last_attempts,
+            'average': last_average
+        }[sort]
+        next_cursor = encode_cursor(last_value, last_user.id)
+
+    return render_template('admin/user_statistics.html',
+                         rows=rows,
+                         sort=sort,
+                         order='desc' if descending else 'asc',
+                         search_query=prefix,
+                         next_cursor=next_cursor,
+                         is_first_page=cursor is None)
 
 @admin.route('/user/<int:user_id>/delete', methods=['POST'])
 def delete_user(user_id):
@@ -303,24 +448,15 @@ def delete_user(user_id):
         return redirect(url_for('admin.user_statistics'))
     
     user = User.query.get_or_404(user_id)
-    
-    # First delete all dependent records
-    # Option 1: Delete all quiz attempts and answers
-    attempts = QuizAttempt.query.filter_by(user_id=user.id).all()
-    for attempt in attempts:
-        # Delete all answers for this attempt
-        UserAnswer.query.filter_by(attempt_id=attempt.id).delete()
-        # Delete the attempt
-        db.session.delete(attempt)
-    
-    # Option 2: Orphan the attempts (if you want to keep attempt data)
-    # QuizAttempt.query.filter_by(user_id=user.id).update({'user_id': None})
-    # Note: This requires nullable user_id in the model
-    
-    # Now delete the user
-    db.session.delete(user)
+    # Logged out and locked out now (see load_principal), even if the deletion waits for a worker
+    user.password_hash = None
+    queued = jobs.enqueue('delete_user', user_id=user.id)
     db.session.commit()
-    flash('User deleted successfully!', 'success')
+    invalidate_principal(user_id)
+    if queued:
+        flash('User deletion queued; it will disappear shortly.', 'info')
+    else:
+        flash('User deleted successfully!', 'success')
     return redirect(url_for('admin.user_statistics'))
 # Add these new routes
 @admin.route('/subject/<int:subject_id>/add-chapter', methods=['GET', 'POST'])
@@ -332,6 +468,8 @@ def add_chapter(subject_id):
                          description=form.description.data,
                          subject_id=subject.id)
         db.session.add(chapter)
+        db.session.flush()
+        search.index('chapter', chapter)
         db.session.commit()
         flash('Chapter added successfully!', 'success')
         return redirect(url_for('admin.view_subject', subject_id=subject.id))
@@ -344,6 +482,7 @@ def edit_chapter(chapter_id):
     if form.validate_on_submit():
         chapter.name = form.name.data
         chapter.description = form.description.data
+        search.index('chapter', chapter)
         db.session.commit()
         flash('Chapter updated successfully!', 'success')
         return redirect(url_for('admin.view_subject', subject_id=chapter.subject_id))
@@ -361,11 +500,23 @@ def view_chapter(chapter_id):
 def delete_chapter(chapter_id):
     chapter = Chapter.query.get_or_404(chapter_id)
     subject_id = chapter.subject_id
+    stats.discard_quizzes(chapter.quizzes)
+    search.remove_chapter(chapter.id)
+    counters.bump(Subject, subject_id, 'quiz_count', -len(chapter.quizzes))
+    counters.discount_attempts(QuizAttempt.quiz_id.in_([quiz.id for quiz in chapter.quizzes]))
     db.session.delete(chapter)
     db.session.commit()
     flash('Chapter deleted successfully!', 'success')
     return redirect(url_for('admin.view_subject', subject_id=subject_id))
 
+@admin.route('/sql-activity')
+def sql_activity():
+    recorder = current_app.extensions.get('qna_sql_recorder')
+    if recorder is None:
+        return render_template('admin/sql_activity.html', enabled=False)
+    return render_template('admin/sql_activity.html', enabled=True,
+                           requests=recorder.recent(), endpoints=recorder.by_endpoint())
+
 # Teacher Management Routes
 @admin.route('/teachers')
 def teachers():
@@ -1,7 +1,9 @@
 from flask_restful import Api
 from .resource import SubjectListResource, SubjectResource
+from .batch import BatchResource
 
 api = Api(prefix = '/api')
 # Register resources
 api.add_resource(SubjectListResource, '/subjects')
-api.add_resource(SubjectResource, '/subjects/<int:subject_id>')
\ No newline at end of file
+api.add_resource(SubjectResource, '/subjects/<int:subject_id>')
+api.add_resource(BatchResource, '/batch')
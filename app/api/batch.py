@@ -0,0 +1,433 @@
+from collections import Counter, namedtuple
+from datetime import datetime
+from functools import wraps
+from flask import jsonify, request
+from flask_login import current_user
+from flask_restful import Resource, abort
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Teacher, Subject, Chapter, Quiz, Question, QuizAttempt
+from app.snapshots import invalidate_quiz_snapshots, discard_quiz_snapshot
+from app import stats, search, counters, fragments
+
+MAX_BATCH_OPERATIONS = 10000
+
+# parent: the model an id must refer to; immutable: may only be set on create
+Field = namedtuple('Field', 'type required default max_length min max parent immutable')
+Field.__new__.__defaults__ = (False, None, None, None, None, None, False)
+
+# Mirrors the admin forms so batch writes obey the same rules as the UI
+FIELDS = {
+    'subject': {
+        'name': Field(str, required=True, max_length=100),
+        'description': Field(str),
+        'teacher_id': Field(int, parent=Teacher),
+    },
+    'chapter': {
+        'name': Field(str, required=True, max_length=100),
+        'description': Field(str),
+        'subject_id': Field(int, required=True, parent=Subject, immutable=True),
+    },
+    'quiz': {
+        'name': Field(str, required=True, max_length=100),
+        'description': Field(str),
+        'time_limit': Field(int, required=True, min=1),
+        'subject_id': Field(int, required=True, parent=Subject, immutable=True),
+        'chapter_id': Field(int, parent=Chapter),
+        'sequence_number': Field(int, default=1, min=1),
+        'max_attempts': Field(int, default=2, min=1, max=10),
+        'passing_score': Field(float, default=70.0, min=0, max=100),
+        'deadline': Field(datetime),
+        'prerequisite_quiz_id': Field(int, parent=Quiz),
+        'full_paper': Field(bool, default=False),
+    },
+    'question': {
+        'text': Field(str, required=True),
+        'marks': Field(int, default=1, min=1),
+        'option1': Field(str, required=True, max_length=200),
+        'option2': Field(str, required=True, max_length=200),
+        'option3': Field(str, required=True, max_length=200),
+        'option4': Field(str, required=True, max_length=200),
+        'correct_option': Field(int, required=True, min=1, max=4),
+        'quiz_id': Field(int, required=True, parent=Quiz, immutable=True),
+    },
+}
+
+MODELS = {'subject': Subject, 'chapter': Chapter, 'quiz': Quiz, 'question': Question}
+
+# Kinds shown on the cached student pages
+CATALOG_KINDS = ('subject', 'chapter', 'quiz')
+
+# Parents are created before their children and deleted after them
+CREATE_ORDER = ('subject', 'chapter', 'quiz', 'question')
+DELETE_ORDER = CREATE_ORDER[::-1]
+
+# Columns loaded for the rows a batch touches; the second one is the parent id
+EXISTING_COLUMNS = {
+    Subject: (Subject.id, Subject.teacher_id),
+    Chapter: (Chapter.id, Chapter.subject_id),
+    Quiz: (Quiz.id, Quiz.subject_id, Quiz.chapter_id),
+    Question: (Question.id, Question.quiz_id),
+}
+
+
+class BatchError(Exception):
+    pass
+
+
+def _coerce(name, field, value):
+    if value is None or value == '':
+        if field.required:
+            raise BatchError(f'{name} is required')
+        return field.default if value is None else None
+    if field.type is datetime:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise BatchError(f'{name} must be an ISO 8601 date')
+    if field.type is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if not isinstance(value, field.type) or (field.type is not bool and isinstance(value, bool)):
+        raise BatchError(f'{name} must be of type {field.type.__name__}')
+    if field.max_length is not None and len(value) > field.max_length:
+        raise BatchError(f'{name} must be at most {field.max_length} characters')
+    if field.min is not None and value < field.min:
+        raise BatchError(f'{name} must be at least {field.min}')
+    if field.max is not None and value > field.max:
+        raise BatchError(f'{name} must be at most {field.max}')
+    return value
+
+
+def _is_ref(field, value):
+    return field.parent is not None and isinstance(value, str) and value.startswith('$')
+
+
+class Batch:
+    """Validates a list of operations, then applies them set-wise in one transaction.
+
+    Operations look like {"op": "create", "type": "quiz", "ref": "q1", "data": {...}},
+    {"op": "update", "type": "quiz", "id": 5, "data": {...}} or
+    {"op": "delete", "type": "quiz", "id": 5}. Any parent id may instead be
+    "$<ref>" of an object created in the same batch. All creates run first
+    (subjects, chapters, quizzes, questions), then updates, then deletes.
+    """
+
+    def __init__(self, operations):
+        self.operations = operations
+        self.results = [{'index': index} for index in range(len(operations))]
+        self.failed = False
+        self.refs = {}
+        self.existing = {}
+        self.subject_of = {Chapter: {}, Quiz: {}}  # parent subject of every chapter/quiz seen
+
+    def fail(self, index, message):
+        self.results[index]['error'] = message
+        self.failed = True
+
+    def run(self):
+        """Apply the batch; returns False, with errors in results, if nothing could be applied"""
+        items = [self.parse(index, operation) for index, operation in enumerate(self.operations)]
+        items = [item for item in items if item is not None]
+        self.check_references(items)
+        if self.failed:
+            return False
+
+        try:
+            for kind in CREATE_ORDER:
+                self.create(kind, [i for i in items if i['op'] == 'create' and i['type'] == kind])
+            for kind in CREATE_ORDER:
+                self.update(kind, [i for i in items if i['op'] == 'update' and i['type'] == kind])
+            for kind in DELETE_ORDER:
+                self.delete(kind, [i for i in items if i['op'] == 'delete' and i['type'] == kind])
+        except BatchError:
+            self.failed = True
+        if self.failed:
+            # Nothing is committed, so drop the statuses and ids of the rolled back work
+            for result in self.results:
+                result.pop('status', None)
+                if result.get('op') == 'create':
+                    result.pop('id', None)
+            return False
+        return True
+
+    def parse(self, index, operation):
+        try:
+            if not isinstance(operation, dict):
+                raise BatchError('operation must be an object')
+            op, kind = operation.get('op'), operation.get('type')
+            if op not in ('create', 'update', 'delete'):
+                raise BatchError('op must be create, update or delete')
+            if kind not in FIELDS:
+                raise BatchError(f"type must be one of {', '.join(FIELDS)}")
+            self.results[index].update(op=op, type=kind)
+            item = {'index': index, 'op': op, 'type': kind}
+
+            if op == 'create':
+                item['ref'] = operation.get('ref')
+                item['values'] = self.parse_data(kind, operation.get('data'), partial=False)
+                return item
+
+            object_id = operation.get('id')
+            if not isinstance(object_id, int) or isinstance(object_id, bool):
+                raise BatchError('id must be an integer')
+            item['id'] = object_id
+            self.results[index]['id'] = object_id
+            if op == 'update':
+                item['values'] = self.parse_data(kind, operation.get('data'), partial=True)
+            return item
+        except BatchError as e:
+            self.fail(index, str(e))
+            return None
+
+    def parse_data(self, kind, data, partial):
+        if not isinstance(data, dict):
+            raise BatchError('data must be an object')
+        unknown = [name for name in data if name not in FIELDS[kind]]
+        if unknown:
+            raise BatchError(f"unknown fields: {', '.join(unknown)}")
+        values = {}
+        for name, field in FIELDS[kind].items():
+            if name not in data:
+                if not partial:
+                    values[name] = _coerce(name, field, None)
+                continue
+            if partial and field.immutable:
+                raise BatchError(f'{name} cannot be changed')
+            value = data[name]
+            values[name] = value if _is_ref(field, value) else _coerce(name, field, value)
+        if partial and not values:
+            raise BatchError('data must not be empty')
+        return values
+
+    def check_references(self, items):
+        """Check targets, parents and refs exist, with one IN query per model"""
+        refs = {}
+        seen = set()
+        wanted = {model: set() for model in (Teacher, Subject, Chapter, Quiz, Question)}
+        for item in items:
+            model = MODELS[item['type']]
+            if item['op'] == 'create':
+                if item['ref'] is not None:
+                    if item['ref'] in refs:
+                        self.fail(item['index'], f"duplicate ref {item['ref']}")
+                    refs[item['ref']] = item['type']
+            else:
+                key = (item['type'], item['id'])
+                if key in seen:
+                    self.fail(item['index'], f"{item['type']} {item['id']} appears more than once")
+                seen.add(key)
+                wanted[model].add(item['id'])
+            for name, value in item.get('values', {}).items():
+                parent = FIELDS[item['type']][name].parent
+                if parent is not None and isinstance(value, int):
+                    wanted[parent].add(value)
+
+        for model, ids in wanted.items():
+            if ids:
+                columns = EXISTING_COLUMNS.get(model, (model.id,))
+                rows = db.session.query(*columns).filter(model.id.in_(ids)).all()
+                self.existing[model] = {row[0]: row for row in rows}
+                if model in self.subject_of:
+                    self.subject_of[model].update((row[0], row[1]) for row in rows)
+
+        for item in items:
+            if 'error' in self.results[item['index']]:
+                continue
+            if item['op'] != 'create' and item['id'] not in self.existing.get(MODELS[item['type']], {}):
+                self.fail(item['index'], f"{item['type']} {item['id']} not found")
+                continue
+            for name, value in item.get('values', {}).items():
+                field = FIELDS[item['type']][name]
+                parent_kind = field.parent.__name__.lower() if field.parent else None
+                if field.parent is None or value is None:
+                    continue
+                if _is_ref(field, value):
+                    # A create can only refer to kinds created before its own
+                    if refs.get(value[1:]) != parent_kind or (
+                            item['op'] == 'create'
+                            and CREATE_ORDER.index(parent_kind) >= CREATE_ORDER.index(item['type'])):
+                        self.fail(item['index'], f'{name}: unknown {parent_kind} ref {value}')
+                        break
+                elif value not in self.existing.get(field.parent, {}):
+                    self.fail(item['index'], f'{name}: {parent_kind} {value} not found')
+                    break
+
+    def resolve(self, kind, values):
+        return {
+            name: self.refs[value[1:]] if _is_ref(FIELDS[kind][name], value) else value
+            for name, value in values.items()
+        }
+
+    def check_same_subject(self, item, row, subject_id):
+        """A quiz's chapter and prerequisite must belong to the quiz's own subject"""
+        for name, model in (('chapter_id', Chapter), ('prerequisite_quiz_id', Quiz)):
+            if row.get(name) is not None and self.subject_of[model].get(row[name]) != subject_id:
+                self.fail(item['index'], f'{name}: {model.__name__.lower()} {row[name]} '
+                                         f'does not belong to subject {subject_id}')
+                raise BatchError()
+
+    def create(self, kind, items):
+        if not items:
+            return
+        model = MODELS[kind]
+        rows = [self.resolve(kind, item['values']) for item in items]
+        if kind == 'quiz':
+            for item, row in zip(items, rows):
+                self.check_same_subject(item, row, row['subject_id'])
+        ids = db.session.scalars(
+            db.insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        ).all()
+        for item, row, object_id in zip(items, rows, ids):
+            row['id'] = object_id
+            if item['ref'] is not None:
+                self.refs[item['ref']] = object_id
+            self.results[item['index']].update(status='created', id=object_id)
+            if model in self.subject_of:
+                self.subject_of[model][object_id] = row['subject_id']
+
+        if kind == 'subject':
+            stats.create_rollups_many(subject_ids=ids)
+            self.bump(Teacher, 'subject_count', Counter(row['teacher_id'] for row in rows))
+        elif kind == 'quiz':
+            stats.create_rollups_many(quizzes=[(row['id'], row['subject_id']) for row in rows])
+            self.bump(Subject, 'quiz_count', Counter(row['subject_id'] for row in rows))
+            self.bump(Chapter, 'quiz_count', Counter(row['chapter_id'] for row in rows))
+        elif kind == 'question':
+            quiz_counts = Counter(row['quiz_id'] for row in rows)
+            self.bump(Quiz, 'question_count', quiz_counts)
+            invalidate_quiz_snapshots(quiz_counts)
+        search.index_ids(kind, ids)
+        self.invalidate_fragments(kind)
+
+    def update(self, kind, items):
+        if not items:
+            return
+        model = MODELS[kind]
+        existing = self.existing[model]
+        now = datetime.utcnow()
+        rows = [dict(self.resolve(kind, item['values']), id=item['id'], updated_at=now) for item in items]
+        if kind == 'quiz':
+            for item, row in zip(items, rows):
+                self.check_same_subject(item, row, existing[row['id']][1])
+
+        # Bulk UPDATE by primary key, one executemany per distinct set of columns
+        for columns in {tuple(sorted(row)) for row in rows}:
+            db.session.execute(db.update(model), [row for row in rows if tuple(sorted(row)) == columns])
+        for item in items:
+            self.results[item['index']]['status'] = 'updated'
+
+        if kind == 'subject':
+            self.move(Teacher, 'subject_count', existing, rows, 'teacher_id', 1)
+        elif kind == 'quiz':
+            self.move(Chapter, 'quiz_count', existing, rows, 'chapter_id', 2)
+        elif kind == 'question':
+            invalidate_quiz_snapshots({existing[row['id']][1] for row in rows})
+        search.index_ids(kind, [row['id'] for row in rows])
+        self.invalidate_fragments(kind)
+
+    def delete(self, kind, items):
+        """Deletes go through the ORM, like the admin views, so relationship cascades apply"""
+        if not items:
+            return
+        model = MODELS[kind]
+        objects = model.query.filter(model.id.in_([item['id'] for item in items])).all()
+        quiz_owner = {'subject': Quiz.subject_id, 'chapter': Quiz.chapter_id, 'quiz': Quiz.id}.get(kind)
+        if quiz_owner is not None:
+            # The cascade takes the attempts of the deleted quizzes with it
+            quiz_ids = db.select(Quiz.id).where(quiz_owner.in_([obj.id for obj in objects]))
+            counters.discount_attempts(QuizAttempt.quiz_id.in_(quiz_ids))
+        for obj in objects:
+            if kind == 'subject':
+                stats.discard_subject(obj.id)
+                search.remove_subject(obj.id)
+                counters.bump(Teacher, obj.teacher_id, 'subject_count', -1)
+                for quiz in obj.quizzes:
+                    discard_quiz_snapshot(quiz.id)
+            elif kind == 'chapter':
+                stats.discard_quizzes(obj.quizzes)
+                search.remove_chapter(obj.id)
+                counters.bump(Subject, obj.subject_id, 'quiz_count', -len(obj.quizzes))
+                for quiz in obj.quizzes:
+                    discard_quiz_snapshot(quiz.id)
+            elif kind == 'quiz':
+                stats.discard_quizzes([obj])
+                search.remove_quiz(obj.id)
+                counters.bump(Subject, obj.subject_id, 'quiz_count', -1)
+                counters.bump(Chapter, obj.chapter_id, 'quiz_count', -1)
+                discard_quiz_snapshot(obj.id)
+            else:
+                search.remove('question', obj.id)
+                counters.bump(Quiz, obj.quiz_id, 'question_count', -1)
+            db.session.delete(obj)
+        if kind == 'question':
+            invalidate_quiz_snapshots({obj.quiz_id for obj in objects})
+        db.session.flush()
+        self.invalidate_fragments(kind)
+        for item in items:
+            self.results[item['index']]['status'] = 'deleted'
+
+    @staticmethod
+    def invalidate_fragments(kind):
+        # Bulk INSERTs and UPDATEs skip the session's flush, so the catalog
+        # version isn't moved on for them automatically
+        if kind in CATALOG_KINDS:
+            fragments.bump()
+
+    def move(self, parent, column, existing, rows, foreign_key, position):
+        """Shift counter caches for rows whose foreign_key changed"""
+        deltas = Counter()
+        for row in rows:
+            if foreign_key in row:
+                old = existing[row['id']][position]
+                if old != row[foreign_key]:
+                    deltas[old] -= 1
+                    deltas[row[foreign_key]] += 1
+        self.bump(parent, column, deltas)
+
+    @staticmethod
+    def bump(model, column, deltas):
+        for object_id, delta in deltas.items():
+            counters.bump(model, object_id, column, delta)
+
+
+def _response(body, status=200):
+    response = jsonify(body)
+    response.status_code = status
+    return response
+
+
+def admin_required(view):
+    """Only a logged-in quiz master may use the wrapped API method"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            abort(401, message='Log in as a quiz master to use this endpoint')
+        if not current_user.is_admin:
+            abort(403, message='Only quiz masters may use this endpoint')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class BatchResource(Resource):
+    method_decorators = {'post': [admin_required]}
+
+    def post(self):
+        """Apply an array of create/update/delete operations in one transaction"""
+        payload = request.get_json(silent=True)
+        operations = payload.get('operations') if isinstance(payload, dict) else payload
+        if not isinstance(operations, list) or not operations:
+            abort(400, message='Expected a non-empty list of operations')
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            abort(413, message=f'At most {MAX_BATCH_OPERATIONS} operations per batch')
+
+        batch = Batch(operations)
+        try:
+            applied = batch.run()
+        except IntegrityError as e:
+            db.session.rollback()
+            return _response({'message': f'Batch violates a database constraint: {e.orig}',
+                              'results': batch.results}, 409)
+        if not applied:
+            db.session.rollback()
+            return _response({'message': 'No changes were applied', 'results': batch.results}, 422)
+        db.session.commit()
+        return jsonify({'results': batch.results})
@@ -1,8 +1,78 @@
-from flask_restful import Api, Resource, reqparse
-from flask import jsonify, request
-from app.models import Subject, db
+import hashlib
+from flask_restful import Api, Resource, reqparse, abort
+from flask import jsonify, request, url_for, current_app
+from sqlalchemy.orm import load_only, selectinload
+from app.models import Subject, Teacher, Chapter, Quiz, QuizAttempt, db
+from app import stats, search, counters
+from app.snapshots import discard_quiz_snapshot
+from app.pagination import encode_cursor, decode_cursor
+from app.replica import read_replica
 
 
+SUBJECTS_PER_PAGE = 100
+MAX_SUBJECTS_PER_PAGE = 500
+
+# Columns a client may pick with ?fields=
+SUBJECT_FIELDS = {
+    'id': Subject.id,
+    'name': Subject.name,
+    'description': Subject.description,
+    'teacher_id': Subject.teacher_id,
+    'quiz_count': Subject.quiz_count,
+    'created_at': Subject.created_at,
+    'updated_at': Subject.updated_at,
+}
+DEFAULT_SUBJECT_FIELDS = ('id', 'name', 'description', 'created_at')
+
+# Relationships a client may inline with ?embed=, and the child columns sent for each
+SUBJECT_EMBEDS = {
+    'chapters': (Subject.chapters, Chapter, ('id', 'name', 'description')),
+    'quizzes': (Subject.quizzes, Quiz, ('id', 'name', 'description', 'chapter_id',
+                                        'sequence_number', 'time_limit', 'deadline')),
+}
+
+
+def _serialize(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _list_arg(name, allowed, default=()):
+    """Comma separated query argument, rejecting names not in allowed"""
+    raw = request.args.get(name)
+    if raw is None:
+        return list(default)
+    names = []
+    for item in raw.split(','):
+        item = item.strip()
+        if item and item not in names:
+            names.append(item)
+    unknown = [item for item in names if item not in allowed]
+    if unknown:
+        abort(400, message=f"Unknown {name}: {', '.join(unknown)}")
+    return names
+
+
+def _collection_version(models):
+    """Cheap ETag seed for the listed tables.
+
+    One aggregate query per table; a new, edited or deleted row changes
+    the count, the highest id or the newest updated_at. Each aggregate is
+    answered from an index (rows from before updated_at existed are filled
+    in by `flask upgrade-db`). There is no Last-Modified: the newest
+    updated_at doesn't move when a row is deleted.
+    """
+    seed = []
+    for model in models:
+        count, max_id, newest = db.session.query(
+            db.func.count(model.id), db.func.max(model.id), db.func.max(model.updated_at)
+        ).one()
+        seed.append((model.__tablename__, count, max_id, newest.isoformat() if newest else None))
+    return seed
+
+
+def _not_modified(etag):
+    """True when the client's cached copy (If-None-Match) is still current"""
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
 
 
 # Request parser setup
@@ -13,21 +83,84 @@ subject_parser.add_argument('description', type=str,
                           required=False, location='json')
 
 class SubjectListResource(Resource):
+    method_decorators = {'get': [read_replica]}
+
     def get(self):
-        """Get all subjects"""
-        subjects = Subject.query.all()
-        return jsonify([{
-            'id': s.id,
-            'name': s.name,
-            'description': s.description,
-            'created_at': s.created_at.isoformat() if s.created_at else None
-        } for s in subjects])
+        """List subjects a page at a time.
+
+        ?limit= and ?cursor= page by id, ?fields= picks the subject columns,
+        ?embed=chapters,quizzes inlines the children. Responses carry an
+        ETag so pollers get a 304 without any rows loaded.
+        """
+        fields = _list_arg('fields', SUBJECT_FIELDS, DEFAULT_SUBJECT_FIELDS)
+        if 'id' not in fields:
+            fields.insert(0, 'id')  # needed for the cursor and embedding
+        embeds = _list_arg('embed', SUBJECT_EMBEDS)
+        limit = request.args.get('limit', SUBJECTS_PER_PAGE, type=int)
+        limit = max(1, min(limit, MAX_SUBJECTS_PER_PAGE))
+        last_id = 0
+        if request.args.get('cursor'):
+            cursor = decode_cursor(request.args['cursor'])
+            if not cursor or not isinstance(cursor[0], int):
+                abort(400, message='Invalid cursor')
+            last_id = cursor[0]
+
+        seed = _collection_version(
+            [Subject] + [SUBJECT_EMBEDS[name][1] for name in embeds]
+        )
+        etag = hashlib.sha1(repr((seed, sorted(request.args.items(multi=True)))).encode()).hexdigest()
+        if _not_modified(etag):
+            response = current_app.response_class(status=304)
+        else:
+            rows = self._page(fields, embeds, last_id, limit + 1)
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            response = jsonify(rows)
+            if has_next:
+                args = request.args.to_dict()
+                args['cursor'] = encode_cursor(rows[-1]['id'])
+                next_url = url_for(request.endpoint, **args)
+                response.headers['Link'] = f'<{next_url}>; rel="next"'
+                response.headers['X-Next-Cursor'] = args['cursor']
+
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def _page(fields, embeds, last_id, limit):
+        if not embeds:
+            # Plain column query: only the requested columns leave the database
+            query = db.session.query(*[SUBJECT_FIELDS[name] for name in fields])
+            query = query.filter(Subject.id > last_id).order_by(Subject.id).limit(limit)
+            return [{name: _serialize(value) for name, value in row._mapping.items()} for row in query]
+
+        options = [load_only(*[SUBJECT_FIELDS[name] for name in fields])]
+        for name in embeds:
+            relationship, model, columns = SUBJECT_EMBEDS[name]
+            options.append(selectinload(relationship).load_only(*[getattr(model, c) for c in columns]))
+        subjects = Subject.query.options(*options).filter(
+            Subject.id > last_id
+        ).order_by(Subject.id).limit(limit).all()
+
+        rows = []
+        for subject in subjects:
+            row = {name: _serialize(getattr(subject, name)) for name in fields}
+            for name in embeds:
+                _, _, columns = SUBJECT_EMBEDS[name]
+                children = sorted(getattr(subject, name), key=lambda child: child.id)
+                row[name] = [{c: _serialize(getattr(child, c)) for c in columns} for child in children]
+            rows.append(row)
+        return rows
 
     def post(self):
         """Create new subject"""
         args = subject_parser.parse_args()
         subject = Subject(name=args['name'], description=args.get('description'))
         db.session.add(subject)
+        db.session.flush()
+        stats.create_rollups(subject_id=subject.id)
+        search.index('subject', subject)
         db.session.commit()
         return jsonify({
             'id': subject.id,
@@ -37,6 +170,8 @@ class SubjectListResource(Resource):
         }), 201
 
 class SubjectResource(Resource):
+    method_decorators = {'get': [read_replica]}
+
     def get(self, subject_id):
         """Get single subject"""
         subject = Subject.query.get_or_404(subject_id)
@@ -56,6 +191,7 @@ class SubjectResource(Resource):
         if args['description'] is not None:
             subject.description = args['description']
             
+        search.index('subject', subject)
         db.session.commit()
         return jsonify({
             'id': subject.id,
@@ -67,7 +203,14 @@ class SubjectResource(Resource):
     def delete(self, subject_id):
         """Delete subject"""
         subject = Subject.query.get_or_404(subject_id)
+        stats.discard_subject(subject.id)
+        search.remove_subject(subject.id)
+        counters.bump(Teacher, subject.teacher_id, 'subject_count', -1)
+        quiz_ids = [quiz.id for quiz in subject.quizzes]
+        counters.discount_attempts(QuizAttempt.quiz_id.in_(quiz_ids))
         db.session.delete(subject)
         db.session.commit()
+        for quiz_id in quiz_ids:
+            discard_quiz_snapshot(quiz_id)
         return jsonify({'message': 'Subject deleted successfully'})
 
@@ -1,6 +1,6 @@
 from flask import render_template, url_for, flash, redirect, request, Blueprint
 from flask_login import login_user, current_user, logout_user, login_required
-from app import db
+from app import db, counters
 from app.models import User
 from app.auth.forms import LoginForm, RegistrationForm, QuizMasterLoginForm
 
@@ -26,6 +26,7 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
             login_user(user, remember=True)
+            db.session.commit()  # saves a rehashed password
             next_page = request.args.get('next')
             if user.is_admin:
                 return redirect(next_page) if next_page else redirect(url_for('admin.dashboard'))
@@ -45,6 +46,7 @@ def quizmaster_login():
         user = User.query.filter_by(username=form.username.data, is_admin=True).first()
         if user and user.check_password(form.password.data):
             login_user(user, remember=True)
+            db.session.commit()  # saves a rehashed password
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('admin.dashboard'))
         else:
@@ -65,6 +67,8 @@ def register():
         )
         user.set_password(form.password.data)
         db.session.add(user)
+        db.session.flush()
+        counters.bump_total('students')
         db.session.commit()
         flash('Your account has been created! You can now log in', 'success')
         return redirect(url_for('auth.login'))
@@ -0,0 +1,262 @@
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case
+from app.models import db, QuizAttempt, UserAnswer, Question
+from app.utils import calculate_score
+from app import stats, search, counters, exports, schema, queryplans, replica, synthetic, sweeper, jobs, fragments, snapshots
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_scores)
+    app.cli.add_command(rebuild_stats)
+    app.cli.add_command(rebuild_search_index)
+    app.cli.add_command(check_counters)
+    app.cli.add_command(export_data)
+    app.cli.add_command(init_db)
+    app.cli.add_command(upgrade_db)
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(sync_replica)
+    app.cli.add_command(generate_data)
+    app.cli.add_command(sweep_attempts)
+    app.cli.add_command(job_status)
+    app.cli.add_command(retry_jobs)
+    app.cli.add_command(clear_fragment_cache)
+
+
+@click.command('backfill-scores')
+@click.option('--rescore', is_flag=True, help='Also recompute the score of completed attempts.')
+@click.option('--batch-size', default=1000, show_default=True)
+@with_appcontext
+def backfill_scores(rescore, batch_size):
+    """Populate the running score counters of existing quiz attempts."""
+    marks = db.func.coalesce(Question.marks, 0)
+    updated = 0
+    last_id = 0
+    while True:
+        attempts = db.session.query(QuizAttempt.id, QuizAttempt.completed, QuizAttempt.quiz_id).filter(
+            QuizAttempt.id > last_id
+        ).order_by(QuizAttempt.id).limit(batch_size).all()
+        if not attempts:
+            break
+
+        # Answer totals for this batch of attempts in one grouped query
+        totals = db.session.query(
+            UserAnswer.attempt_id,
+            db.func.count(UserAnswer.id),
+            db.func.sum(case((UserAnswer.is_correct == True, 1), else_=0)),
+            db.func.sum(case((UserAnswer.is_correct == True, marks), else_=0)),
+            db.func.sum(marks)
+        ).join(Question, UserAnswer.question_id == Question.id
+        ).filter(UserAnswer.attempt_id.between(attempts[0].id, attempts[-1].id)
+        ).group_by(UserAnswer.attempt_id)
+        totals = {row[0]: row[1:] for row in totals}
+        quiz_marks = snapshots.total_marks({quiz_id for _, _, quiz_id in attempts}) if rescore else {}
+
+        rows = []
+        for attempt_id, completed, quiz_id in attempts:
+            answered, correct, earned, possible = totals.get(attempt_id, (0, 0, 0, 0))
+            row = {
+                'id': attempt_id,
+                'answered_count': answered,
+                'correct_count': correct,
+                'marks_earned': earned,
+                'marks_possible': possible
+            }
+            if rescore and completed:
+                row['score'] = calculate_score(QuizAttempt(marks_earned=earned), quiz_marks.get(quiz_id))
+            rows.append(row)
+        db.session.execute(db.update(QuizAttempt), rows)
+        db.session.commit()
+
+        updated += len(rows)
+        last_id = attempts[-1].id
+
+    click.echo(f'Backfilled score counters for {updated} attempts.')
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats():
+    """Recompute the subject and quiz statistics rollups from scratch."""
+    stats.rebuild()
+    db.session.commit()
+    click.echo('Statistics rollups rebuilt.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index():
+    """Re-index every subject, chapter, quiz and question for search."""
+    search.create_fts_index()
+    search.rebuild()
+    db.session.commit()
+    engine = 'FTS5' if search.fts_enabled() else 'LIKE fallback'
+    click.echo(f'Search index rebuilt ({engine}).')
+
+
+@click.command('check-counters')
+@click.option('--repair', is_flag=True, help='Overwrite wrong counter caches with the real counts.')
+@with_appcontext
+def check_counters(repair):
+    """Verify the denormalized count columns against the real row counts."""
+    mismatches = counters.check(repair=repair)
+    for model, object_id, column, cached, actual in mismatches:
+        click.echo(f'{model} {object_id}: {column} is {cached}, expected {actual}')
+    if repair:
+        db.session.commit()
+        click.echo(f'Repaired {len(mismatches)} counter(s).')
+    elif mismatches:
+        raise SystemExit(1)
+    else:
+        click.echo('All counters are consistent.')
+
+
+@click.command('export')
+@click.argument('dataset', type=click.Choice(exports.EXPORT_DATASETS))
+@click.option('--format', 'fmt', type=click.Choice(list(exports.EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write; defaults to stdout.')
+@click.option('--subject-id')
+@click.option('--quiz-id')
+@click.option('--user-id')
+@click.option('--since', help='ISO date or datetime (inclusive).')
+@click.option('--until', help='ISO date or datetime; a bare date includes that day.')
+@with_appcontext
+def export_data(dataset, fmt, output, **filters):
+    """Stream quiz attempts or answers as CSV or NDJSON."""
+    try:
+        filters = exports.parse_filters(**filters)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    for chunk in exports.export_rows(dataset, fmt, **filters):
+        output.write(chunk)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create the tables, search index and quizmaster account a new database needs."""
+    for change in schema.initialize():
+        click.echo(change)
+    click.echo('Database is ready.')
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Add the tables, columns and indexes an existing database is missing."""
+    changes = 0
+    for change in schema.upgrade():
+        click.echo(change)
+        changes += 1
+    click.echo('Database is up to date.' if not changes else f'{changes} change(s) applied.')
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans():
+    """Fail if a hot page runs a query that falls back to a full table scan.
+
+    Runs the pages against a scratch SQLite database built from the models,
+    so the real database is not touched.
+    """
+    offenders = queryplans.check_query_plans(current_app.config)
+    for page, table, statement in offenders:
+        click.echo(f'{page}: full scan of {table}\n    {" ".join(statement.split())}\n')
+    if offenders:
+        raise SystemExit(1)
+    click.echo('No unexpected full table scans.')
+
+
+@click.command('sync-replica')
+@with_appcontext
+def sync_replica():
+    """Copy the SQLite database to the REPLICA_DATABASE_URL file.
+
+    Run it on a schedule (e.g. from cron every minute) more often than
+    REPLICA_MAX_LAG_SECONDS, or reads fall back to the primary.
+    """
+    if replica.REPLICA_BIND not in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        raise click.UsageError('REPLICA_DATABASE_URL is not set.')
+    try:
+        as_of = replica.sync_sqlite_replica()
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f'Replica synced as of {as_of.isoformat(timespec="seconds")}.')
+
+
+@click.command('generate-data')
+@click.option('--teachers', default=10, show_default=True)
+@click.option('--subjects', default=20, show_default=True)
+@click.option('--chapters', default=5, show_default=True, help='Per subject.')
+@click.option('--quizzes', default=4, show_default=True, help='Per chapter.')
+@click.option('--questions', default=10, show_default=True, help='Per quiz.')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--attempts', default=5, show_default=True, help='Completed attempts per user.')
+@click.option('--password', default='password', show_default=True, help='Password of every generated student.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--batch-size', default=20000, show_default=True)
+@with_appcontext
+def generate_data(teachers, subjects, chapters, quizzes, questions, users, attempts, password, seed, batch_size):
+    """Add a synthetic dataset for load testing, alongside any existing data."""
+    started = time.perf_counter()
+    for line in synthetic.generate(teachers, subjects, chapters, quizzes, questions, users,
+                                   attempts, password, seed, batch_size):
+        click.echo(f'[{time.perf_counter() - started:7.1f}s] {line}')
+
+
+@click.command('sweep-attempts')
+@click.option('--loop', is_flag=True, help='Keep sweeping every --interval seconds until interrupted.')
+@click.option('--interval', default=60, show_default=True)
+@click.option('--batch-size', default=sweeper.SWEEP_BATCH_SIZE, show_default=True)
+@with_appcontext
+def sweep_attempts(loop, interval, batch_size):
+    """Score and close attempts whose time limit ran out without a submission."""
+    while True:
+        closed = sweeper.sweep_expired_attempts(batch_size=batch_size)
+        if closed or not loop:
+            click.echo(f'Closed {closed} expired attempt(s).')
+        if not loop:
+            return
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            return
+
+
+@click.command('job-status')
+@with_appcontext
+def job_status():
+    """Show the background job queue: depth per job and status, lag and recent failures."""
+    counts, lag, failures = jobs.status()
+    if not counts:
+        click.echo('The job queue is empty.')
+        return
+    for name, status, count in sorted(counts):
+        click.echo(f'{name:<28} {status:<8} {count:>8}')
+    click.echo(f'Oldest due job has waited {lag:.1f}s.')
+    for job in failures:
+        error = (job.last_error or '').strip().splitlines()
+        click.echo(f'Failed: job {job.id} {job.name} {job.payload} after {job.attempts} attempt(s): '
+                   f'{error[-1] if error else "-"}')
+
+
+@click.command('retry-jobs')
+@click.option('--name', default=None, help='Only retry failed jobs with this name.')
+@with_appcontext
+def retry_jobs(name):
+    """Put failed background jobs back on the queue."""
+    click.echo(f'Requeued {jobs.retry_failed(name)} failed job(s).')
+
+
+@click.command('clear-fragment-cache')
+@with_appcontext
+def clear_fragment_cache():
+    """Invalidate the cached student page fragments in every process."""
+    fragments.bump()
+    db.session.commit()
+    cache = current_app.extensions.get('qna_fragment_cache')
+    if cache is not None:
+        cache.clear()
+    click.echo('Fragment cache cleared.')
@@ -0,0 +1,108 @@
+from app.models import db, User, Teacher, Subject, Chapter, Quiz, Question, QuizAttempt, Total
+from app import fragments
+
+# (parent model, counter column, child model, child foreign key) for every counter cache
+COUNTERS = [
+    (Teacher, 'subject_count', Subject, 'teacher_id'),
+    (Subject, 'quiz_count', Quiz, 'subject_id'),
+    (Chapter, 'quiz_count', Quiz, 'chapter_id'),
+    (Quiz, 'question_count', Question, 'quiz_id'),
+    (User, 'attempt_count', QuizAttempt, 'user_id'),
+]
+
+# Total name -> (model, criteria) for every whole-table count kept in Total
+TOTALS = {
+    'students': (User, (User.is_admin.is_(False),)),
+}
+
+
+def _actual_total(name):
+    model, criteria = TOTALS[name]
+    return db.session.query(db.func.count(model.id)).filter(*criteria).scalar()
+
+
+def bump(model, object_id, column, delta=1):
+    """Adjust a counter cache in SQL so concurrent requests don't lose updates"""
+    if object_id is None or not delta:
+        return
+    counter = getattr(model, column)
+    db.session.query(model).filter(model.id == object_id).update(
+        {counter: db.func.coalesce(counter, 0) + delta},
+        synchronize_session=False
+    )
+
+
+def bump_total(name, delta=1):
+    """Adjust a Total in SQL; call after the rows it counts were added or deleted.
+
+    A missing row is created from a real COUNT, which already includes the
+    caller's change.
+    """
+    if not delta:
+        return
+    updated = db.session.execute(
+        db.update(Total).where(Total.name == name).values(value=Total.value + delta),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not updated:
+        db.session.execute(db.insert(Total).values(name=name, value=_actual_total(name)))
+
+
+def total(name):
+    """The value of a Total; 0 until its row is created"""
+    return db.session.scalar(db.select(Total.value).where(Total.name == name)) or 0
+
+
+def discount_attempts(*criteria):
+    """Take the attempts matching criteria off their users' attempt_count.
+
+    Call before the attempts go with a quiz, chapter or subject delete
+    cascade; one UPDATE per affected user.
+    """
+    per_user = db.session.query(QuizAttempt.user_id, db.func.count(QuizAttempt.id)).filter(
+        *criteria
+    ).group_by(QuizAttempt.user_id).all()
+    for user_id, attempts in per_user:
+        bump(User, user_id, 'attempt_count', -attempts)
+
+
+def check(repair=False):
+    """Compare every counter cache and total with a real COUNT; returns the mismatches found.
+
+    Each mismatch is (model name, id, column, cached, actual). With repair
+    the cached values are overwritten with the actual counts.
+    """
+    mismatches = []
+    for parent, column, child, foreign_key in COUNTERS:
+        counter = getattr(parent, column)
+        foreign_key = getattr(child, foreign_key)
+        actual = db.session.query(
+            foreign_key.label('parent_id'),
+            db.func.count().label('actual')
+        ).filter(foreign_key.isnot(None)).group_by(foreign_key).subquery()
+        actual_count = db.func.coalesce(actual.c.actual, 0)
+
+        rows = db.session.query(parent.id, counter, actual_count).outerjoin(
+            actual, actual.c.parent_id == parent.id
+        ).filter(db.or_(counter.is_(None), counter != actual_count)).all()
+        for object_id, cached, count in rows:
+            mismatches.append((parent.__name__, object_id, column, cached, count))
+
+        if repair and rows:
+            db.session.execute(db.update(parent), [
+                {'id': object_id, column: count} for object_id, _, count in rows
+            ])
+
+    # A Total without a row yet counts as 0, as total() reads it
+    cached = dict(db.session.query(Total.name, Total.value).all())
+    for name in TOTALS:
+        count = _actual_total(name)
+        if cached.get(name, 0) != count:
+            mismatches.append((Total.__name__, name, 'value', cached.get(name, 0), count))
+            if repair:
+                db.session.merge(Total(name=name, value=count))
+
+    if repair and mismatches:
+        # Quiz counts are shown on the cached student pages
+        fragments.bump()
+    return mismatches
@@ -0,0 +1,24 @@
+from sqlalchemy import event
+
+
+def _set_pragmas(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_pragmas
+
+
+def configure_engine(app, db):
+    """Apply the config's SQLITE_PRAGMAS to every new connection of each SQLite engine.
+
+    Must run inside an app context before the first connection is made, so
+    each pooled connection gets the PRAGMAs exactly once.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if not pragmas:
+        return
+    for engine in db.engines.values():
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _set_pragmas(pragmas))
@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from app.models import db, User, Quiz, QuizAttempt, UserAnswer
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_DATASETS = ('attempts', 'answers')
+YIELD_PER = 1000
+
+
+def _attempts_query(subject_id=None, quiz_id=None, user_id=None, since=None, until=None):
+    query = db.session.query(
+        QuizAttempt.id.label('attempt_id'),
+        QuizAttempt.user_id,
+        User.username,
+        QuizAttempt.quiz_id,
+        Quiz.name.label('quiz_name'),
+        Quiz.subject_id,
+        QuizAttempt.score,
+        QuizAttempt.completed,
+        QuizAttempt.started_at,
+        QuizAttempt.completed_at,
+        QuizAttempt.answered_count,
+        QuizAttempt.correct_count,
+        QuizAttempt.marks_earned,
+        QuizAttempt.marks_possible
+    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id
+    ).join(User, QuizAttempt.user_id == User.id)
+    return _filter(query, QuizAttempt.started_at, subject_id, quiz_id, user_id, since, until)
+
+
+def _answers_query(subject_id=None, quiz_id=None, user_id=None, since=None, until=None):
+    query = db.session.query(
+        UserAnswer.id.label('answer_id'),
+        UserAnswer.attempt_id,
+        QuizAttempt.user_id,
+        QuizAttempt.quiz_id,
+        UserAnswer.question_id,
+        UserAnswer.selected_option,
+        UserAnswer.is_correct,
+        UserAnswer.answered_at
+    ).join(QuizAttempt, UserAnswer.attempt_id == QuizAttempt.id)
+    if subject_id is not None:
+        query = query.join(Quiz, QuizAttempt.quiz_id == Quiz.id)
+    return _filter(query, UserAnswer.answered_at, subject_id, quiz_id, user_id, since, until)
+
+
+def _filter(query, timestamp, subject_id, quiz_id, user_id, since, until):
+    if subject_id is not None:
+        query = query.filter(Quiz.subject_id == subject_id)
+    if quiz_id is not None:
+        query = query.filter(QuizAttempt.quiz_id == quiz_id)
+    if user_id is not None:
+        query = query.filter(QuizAttempt.user_id == user_id)
+    if since is not None:
+        query = query.filter(timestamp >= since)
+    if until is not None:
+        query = query.filter(timestamp < until)
+    return query
+
+
+QUERIES = {'attempts': _attempts_query, 'answers': _answers_query}
+
+
+def parse_filters(subject_id=None, quiz_id=None, user_id=None, since=None, until=None):
+    """Turn raw filter strings into export filters; raises ValueError on bad input.
+
+    since and until are ISO dates or datetimes; a bare until date includes
+    that whole day.
+    """
+    filters = {}
+    for name, value in (('subject_id', subject_id), ('quiz_id', quiz_id), ('user_id', user_id)):
+        if value not in (None, ''):
+            try:
+                filters[name] = int(value)
+            except ValueError:
+                raise ValueError(f'{name} must be an integer')
+    for name, value in (('since', since), ('until', until)):
+        if value not in (None, ''):
+            try:
+                filters[name] = datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO date, e.g. 2025-01-31')
+            if name == 'until' and len(value) == 10:
+                filters[name] += timedelta(days=1)
+    return filters
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_rows(dataset, fmt, yield_per=YIELD_PER, **filters):
+    """Yield the export as text chunks, one chunk per yield_per rows.
+
+    Rows come from a streaming result (server-side cursor where the driver
+    has one) and are serialized a partition at a time, so memory use does
+    not grow with the size of the export.
+    """
+    query = QUERIES[dataset](**filters)
+    columns = [column['name'] for column in query.column_descriptions]
+    result = db.session.execute(
+        query.order_by(query.column_descriptions[0]['expr']).statement,
+        execution_options={'yield_per': yield_per}
+    )
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for partition in result.partitions():
+            writer.writerows([[_value(value) for value in row] for row in partition])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for partition in result.partitions():
+            yield ''.join(
+                json.dumps(dict(zip(columns, map(_value, row))), separators=(',', ':')) + '\n'
+                for row in partition
+            )
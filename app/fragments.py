@@ -0,0 +1,187 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from app.replica import RoutingSession
+
+CATALOG = 'catalog'
+# Rows that the student subject, chapter and dashboard fragments are rendered from
+CATALOG_TABLES = frozenset({'subject', 'chapter', 'quiz', 'teacher'})
+
+
+class LRUBackend:
+    """In-process fragments, least recently used evicted past max_size"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, html)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, html, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, html)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemBackend:
+    """Fragments as files in directory, shared by every process on the host.
+
+    A file's mtime is its expiry time. Expired files are removed when read,
+    and in a sweep of the directory every SWEEP_EVERY writes, which also
+    collects the fragments of superseded versions.
+    """
+    SWEEP_EVERY = 500
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.writes = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.html')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime < time.time():
+                os.unlink(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, html, ttl):
+        # Write then rename, so readers never see a partial fragment
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(html)
+        expires = time.time() + ttl
+        os.utime(temporary, (expires, expires))
+        os.replace(temporary, self._path(key))
+        self.writes += 1
+        if self.writes % self.SWEEP_EVERY == 0:
+            self.sweep()
+
+    def sweep(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < now:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def current_version(name=CATALOG):
+    """The version of name, read once per request or app context"""
+    from app.models import db, CacheVersion
+    versions = g.setdefault('cache_versions', {})
+    if name not in versions:
+        versions[name] = db.session.scalar(
+            db.select(CacheVersion.version).where(CacheVersion.name == name)
+        ) or 0
+    return versions[name]
+
+
+def bump(name=CATALOG, session=None):
+    """Invalidate every fragment keyed on name by moving its version on, in the caller's transaction"""
+    from app.models import db, CacheVersion
+    session = session or db.session
+    updated = session.execute(
+        db.update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not updated:
+        session.execute(db.insert(CacheVersion).values(name=name, version=1))
+    if has_app_context():
+        g.pop('cache_versions', None)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _bump_on_catalog_change(db_session, flush_context, instances):
+    # Adding, editing or deleting catalog objects through the session
+    # invalidates the catalog fragments in the same transaction. Bulk
+    # INSERT/UPDATE statements skip flushes; their callers call bump()
+    for obj in (*db_session.new, *db_session.dirty, *db_session.deleted):
+        if getattr(obj, '__tablename__', None) in CATALOG_TABLES and (
+                obj not in db_session.dirty or db_session.is_modified(obj, include_collections=False)):
+            bump(CATALOG, db_session)
+            return
+
+
+def cached(parts, render):
+    """Return render()'s HTML, from the cache when a fresh copy keyed on parts exists"""
+    cache = current_app.extensions.get('qna_fragment_cache')
+    if cache is None:
+        return render()
+    key = ':'.join(str(part) for part in (CATALOG, current_version(), *parts))
+    html = cache.get(key)
+    if html is None:
+        html = str(render())
+        cache.set(key, html, current_app.config['FRAGMENT_CACHE_TTL_SECONDS'])
+    return Markup(html)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 'name', key, ... %}...{% endcache %} renders the block once per
+    catalog version and key, then serves it from the fragment cache.
+
+    Only put markup that is the same for every user inside the block.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        return cached(parts, caller)
+
+
+def init_fragments(app):
+    """Enable {% cache %} in templates with the FRAGMENT_CACHE backend ('lru', 'filesystem' or 'none')"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    kind = app.config['FRAGMENT_CACHE']
+    if kind == 'lru':
+        app.extensions['qna_fragment_cache'] = LRUBackend(app.config['FRAGMENT_CACHE_SIZE'])
+    elif kind == 'filesystem':
+        directory = app.config.get('FRAGMENT_CACHE_DIR') or os.path.join(app.instance_path, 'fragment-cache')
+        app.extensions['qna_fragment_cache'] = FileSystemBackend(directory)
+    elif kind != 'none':
+        raise ValueError("FRAGMENT_CACHE must be 'lru', 'filesystem' or 'none'")
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from werkzeug.datastructures import MultiDict
+from app.models import db, Quiz, Question
+from app.admin.forms import QuestionForm
+from app.snapshots import invalidate_quiz_snapshots
+from app import search, counters
+
+QUESTION_FIELDS = ('text', 'marks', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+REQUIRED_COLUMNS = ('text', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    """Counts of an import plus the first MAX_REPORTED_ERRORS row errors"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.aborted = None
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _csv_rows(text):
+    reader = csv.DictReader(text)
+    missing = [name for name in REQUIRED_COLUMNS if name not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+    for row in reader:
+        yield reader.line_num, row, None
+
+
+def _jsonl_rows(text):
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, None, f'invalid JSON: {e}'
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, 'each line must be a JSON object'
+
+
+def _form_errors(form):
+    return '; '.join(f'{name}: {" ".join(messages)}' for name, messages in form.errors.items())
+
+
+def _write_chunk(quiz_id, rows):
+    # Unordered RETURNING keeps this a single multi-row INSERT on SQLite
+    ids = db.session.scalars(db.insert(Question).returning(Question.id), rows).all()
+    search.index_ids('question', ids)
+    counters.bump(Quiz, quiz_id, 'question_count', len(ids))
+    invalidate_quiz_snapshots([quiz_id])
+    db.session.commit()
+    return len(ids)
+
+
+def import_questions(quiz, stream, fmt, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Stream questions from a CSV/JSONL file into quiz, validating each row with QuestionForm.
+
+    Rows are read one at a time and written with one executemany INSERT and
+    commit per chunk, so memory stays flat however large the file. Invalid
+    rows are skipped and reported; with dry_run nothing is written.
+    Raises ValueError if the file can't be read as fmt at all.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported format {fmt}')
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    rows = _csv_rows(text) if fmt == 'csv' else _jsonl_rows(text)
+
+    quiz_id = quiz.id
+    result = ImportResult(dry_run)
+    # One form instance is reprocessed per row; building a form per row costs twice as much
+    form = QuestionForm(formdata=None, meta={'csrf': False})
+    chunk = []
+    line = 0
+    try:
+        for line, row, error in rows:
+            if error is None:
+                # Blank values are left out so fields fall back to their form defaults
+                form.process(MultiDict({
+                    name: str(row[name]) for name in QUESTION_FIELDS if row.get(name) not in (None, '')
+                }))
+                if form.validate():
+                    chunk.append(dict({name: form[name].data for name in QUESTION_FIELDS}, quiz_id=quiz_id))
+                else:
+                    error = _form_errors(form)
+            if error is not None:
+                result.reject(line, error)
+            if len(chunk) >= chunk_size:
+                result.imported += len(chunk) if dry_run else _write_chunk(quiz_id, chunk)
+                chunk = []
+    except UnicodeDecodeError:
+        result.aborted = f'File is not valid UTF-8 after line {line}'
+        chunk = []
+    if chunk:
+        result.imported += len(chunk) if dry_run else _write_chunk(quiz_id, chunk)
+    return result
@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+slow_log = logging.getLogger('qna.slow_requests')
+
+
+class RequestStats:
+    """SQL activity of one request: query count, total DB time and the slowest statements"""
+
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.keep = keep
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.slowest = []  # (seconds, statement), longest first
+
+    def add(self, statement, seconds):
+        self.query_count += 1
+        self.db_seconds += seconds
+        if len(self.slowest) < self.keep or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep:]
+
+
+class Recorder:
+    """The last history requests, for the admin SQL activity page"""
+
+    def __init__(self, history):
+        self.lock = threading.Lock()
+        self.requests = deque(maxlen=history)
+
+    def record(self, entry):
+        with self.lock:
+            self.requests.append(entry)
+
+    def recent(self):
+        with self.lock:
+            return list(reversed(self.requests))
+
+    def by_endpoint(self):
+        """Per-endpoint totals over the recorded requests, busiest in DB time first"""
+        totals = {}
+        for entry in self.recent():
+            total = totals.setdefault(entry['endpoint'], {
+                'endpoint': entry['endpoint'], 'requests': 0, 'queries': 0,
+                'db_ms': 0.0, 'duration_ms': 0.0, 'max_ms': 0.0
+            })
+            total['requests'] += 1
+            total['queries'] += entry['query_count']
+            total['db_ms'] += entry['db_ms']
+            total['duration_ms'] += entry['duration_ms']
+            total['max_ms'] = max(total['max_ms'], entry['duration_ms'])
+        return sorted(totals.values(), key=lambda total: total['db_ms'], reverse=True)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('qna_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['qna_query_started'].pop()
+    if has_request_context():
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.add(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # A statement that raised gets no after_cursor_execute; drop its start
+    # time so the next statement on the connection doesn't pop it
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None and conn.info.get('qna_query_started'):
+        conn.info['qna_query_started'].pop()
+
+
+def _slow_reasons(config, entry, stats):
+    reasons = []
+    if entry['duration_ms'] >= config['SLOW_REQUEST_MS']:
+        reasons.append('duration')
+    if entry['query_count'] >= config['SLOW_REQUEST_QUERY_COUNT']:
+        reasons.append('query_count')
+    if stats.slowest and stats.slowest[0][0] * 1000 >= config['SLOW_QUERY_MS']:
+        reasons.append('slow_query')
+    return reasons
+
+
+def init_instrumentation(app, db):
+    """Time every SQL statement per request when SQL_INSTRUMENTATION is on.
+
+    Adds X-DB-Query-Count, X-DB-Time-Ms and Server-Timing headers to each
+    response, keeps the last SQL_INSTRUMENTATION_HISTORY requests for the
+    admin SQL activity page, and writes a JSON line to the
+    qna.slow_requests logger (and SLOW_REQUEST_LOG, if set) for requests
+    over the SLOW_* thresholds. Queries a streamed response body runs
+    after the view returns are not counted.
+    """
+    if not app.config.get('SQL_INSTRUMENTATION'):
+        return
+    config = app.config
+    recorder = Recorder(config['SQL_INSTRUMENTATION_HISTORY'])
+    app.extensions['qna_sql_recorder'] = recorder
+
+    for engine in db.engines.values():
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+    if config.get('SLOW_REQUEST_LOG') and not slow_log.handlers:
+        handler = logging.FileHandler(config['SLOW_REQUEST_LOG'])
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        slow_log.addHandler(handler)
+    slow_log.setLevel(logging.WARNING)
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = RequestStats(config['SQL_INSTRUMENTATION_TOP'])
+
+    @app.after_request
+    def finish_sql_stats(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats.started
+        entry = {
+            'at': datetime.utcnow().isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint or '-',
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'query_count': stats.query_count,
+            'db_ms': round(stats.db_seconds * 1000, 1),
+            'slowest': [{'ms': round(seconds * 1000, 1), 'statement': ' '.join(statement.split())}
+                        for seconds, statement in stats.slowest],
+        }
+        response.headers['X-DB-Query-Count'] = str(stats.query_count)
+        response.headers['X-DB-Time-Ms'] = f'{stats.db_seconds * 1000:.1f}'
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.query_count} queries", '
+            f'app;dur={duration * 1000:.1f}'
+        )
+        if request.endpoint != 'static':
+            recorder.record(entry)
+            reasons = _slow_reasons(config, entry, stats)
+            if reasons:
+                slow_log.warning(json.dumps(dict(entry, reasons=reasons)))
+        return response
@@ -0,0 +1,168 @@
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case
+from app.models import db, Job
+
+TASKS = {}
+
+
+def task(name):
+    """Register a function as the job called name.
+
+    Tasks take JSON-serializable keyword arguments and must be safe to run
+    again: a job whose worker died is retried. A task that doesn't commit
+    is committed together with its job's "done" mark, and only while its
+    worker still holds the job, so its work takes effect exactly once.
+    """
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def _tasks():
+    from app import tasks  # noqa: F401 (registers the tasks)
+    return TASKS
+
+
+def enqueue(name, **payload):
+    """Queue a job in the current transaction; it is visible to workers once the caller commits.
+
+    Without JOB_QUEUE_ASYNC the task runs right here instead, inside the
+    caller's transaction, and None is returned.
+    """
+    if not current_app.config.get('JOB_QUEUE_ASYNC'):
+        _tasks()[name](**payload)
+        return None
+    job = Job(name=name, payload=json.dumps(payload), run_at=datetime.utcnow(),
+              max_attempts=current_app.config['JOB_MAX_ATTEMPTS'])
+    db.session.add(job)
+    return job
+
+
+def _requeue_stale(now):
+    # A job running longer than JOB_TIMEOUT_SECONDS lost its worker
+    stale = now - timedelta(seconds=current_app.config['JOB_TIMEOUT_SECONDS'])
+    db.session.execute(
+        db.update(Job).where(Job.status == 'running', Job.started_at < stale).values(
+            status=case((Job.attempts >= Job.max_attempts, 'failed'), else_='queued'),
+            last_error='timed out'
+        ),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def claim(worker):
+    """Take the next due job for worker; returns (id, name, payload, attempts, max_attempts) or None"""
+    now = datetime.utcnow()
+    # Polling is a read; the claiming UPDATE only runs when a job is due
+    job_id = db.session.scalar(
+        db.select(Job.id).where(Job.status == 'queued', Job.run_at <= now).order_by(Job.run_at, Job.id).limit(1)
+    )
+    if job_id is None:
+        db.session.rollback()
+        return None
+    claimed = db.session.execute(
+        db.update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+            status='running', worker=worker, started_at=now, attempts=Job.attempts + 1
+        ).returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts),
+        execution_options={'synchronize_session': False}
+    ).first()
+    db.session.commit()
+    return claimed
+
+
+def _still_claimed(job_id, worker, attempts):
+    # False once the job timed out and was requeued or claimed again
+    return db.and_(Job.id == job_id, Job.status == 'running', Job.worker == worker, Job.attempts == attempts)
+
+
+def run_job(job, worker):
+    """Run a claimed job; its work only commits if worker still holds the claim"""
+    job_id, name, payload, attempts, max_attempts = job
+    try:
+        _tasks()[name](**json.loads(payload))
+        marked = db.session.execute(
+            db.update(Job).where(_still_claimed(job_id, worker, attempts)).values(
+                status='done', finished_at=datetime.utcnow()
+            ),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not marked:
+            db.session.rollback()
+            current_app.logger.warning('Job %s (%s) ran past JOB_TIMEOUT_SECONDS and was requeued; '
+                                       'its work was rolled back', job_id, name)
+            return False
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        current_app.logger.error('Job %s (%s) failed on attempt %s:\n%s', job_id, name, attempts, error)
+        retry_in = current_app.config['JOB_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1)
+        db.session.execute(
+            db.update(Job).where(_still_claimed(job_id, worker, attempts)).values(
+                status='failed' if attempts >= max_attempts else 'queued',
+                run_at=datetime.utcnow() + timedelta(seconds=retry_in),
+                last_error=error
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        return False
+
+
+def prune(now=None):
+    """Delete finished jobs older than JOB_RETENTION_HOURS; returns how many"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=current_app.config['JOB_RETENTION_HOURS'])
+    deleted = Job.query.filter(Job.status == 'done', Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def work(stop=None):
+    """Run jobs until stop() is true, sleeping JOB_POLL_SECONDS when the queue is empty"""
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    poll = current_app.config['JOB_POLL_SECONDS']
+    housekeeping_at = 0.0
+    while not (stop and stop()):
+        if time.monotonic() >= housekeeping_at:
+            _requeue_stale(datetime.utcnow())
+            db.session.commit()
+            prune()
+            housekeeping_at = time.monotonic() + 60
+        job = claim(worker)
+        if job is None:
+            time.sleep(poll)
+        else:
+            run_job(job, worker)
+        db.session.remove()
+
+
+def status(now=None):
+    """Queue depth and lag: (counts by (name, status), seconds the oldest due job has waited, recent failures)"""
+    now = now or datetime.utcnow()
+    counts = db.session.query(Job.name, Job.status, db.func.count(Job.id)).group_by(Job.name, Job.status).all()
+    oldest_due = db.session.query(db.func.min(Job.run_at)).filter(
+        Job.status == 'queued', Job.run_at <= now
+    ).scalar()
+    failures = Job.query.filter(Job.status == 'failed').order_by(Job.id.desc()).limit(10).all()
+    lag = (now - oldest_due).total_seconds() if oldest_due else 0.0
+    return counts, lag, failures
+
+
+def retry_failed(name=None):
+    """Put failed jobs (of one name, if given) back on the queue; returns how many"""
+    query = Job.query.filter(Job.status == 'failed')
+    if name:
+        query = query.filter(Job.name == name)
+    retried = query.update({Job.status: 'queued', Job.attempts: 0, Job.run_at: datetime.utcnow()},
+                           synchronize_session=False)
+    db.session.commit()
+    return retried
@@ -1,19 +1,28 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager
+from app.replica import RoutingSession
+from app.passwords import hash_password, verify_password, needs_rehash
+from app.principal import load_principal
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 class User(db.Model, UserMixin):
+    __table_args__ = (
+        db.Index('ix_user_is_admin', 'is_admin'),
+        db.Index('ix_user_created_at', 'created_at'),
+        db.Index('ix_user_attempt_count', 'attempt_count'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     is_admin = db.Column(db.Boolean, default=False)
     age = db.Column(db.Integer)
     interests = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempt_count = db.Column(db.Integer, default=0)  # counter cache of quiz_attempts
     
     # Relationships
     quiz_attempts = db.relationship(
@@ -25,10 +34,19 @@ class User(db.Model, UserMixin):
     )
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify password; on success, rehash it if the hash parameters have changed.
+
+        A rehash only sets password_hash, the caller commits it. Raises
+        app.passwords.HashPoolBusy when the hashing pool is saturated.
+        """
+        if not self.password_hash or not verify_password(self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -41,6 +59,7 @@ class Teacher(db.Model):
     email = db.Column(db.String(120), unique=True)
     bio = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    subject_count = db.Column(db.Integer, default=0)  # counter cache of subjects
 
     # Relationships
     subjects = db.relationship('Subject', backref='teacher', lazy=True)
@@ -49,11 +68,18 @@ class Teacher(db.Model):
         return f'<Teacher {self.name}>'
 
 class Subject(db.Model):
+    __table_args__ = (
+        db.Index('ix_subject_teacher_id', 'teacher_id'),
+        db.Index('ix_subject_updated_at', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id', ondelete='SET NULL'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    quiz_count = db.Column(db.Integer, default=0)  # counter cache of quizzes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     quizzes = db.relationship(
@@ -75,11 +101,18 @@ class Subject(db.Model):
         return f'<Subject {self.name}>'
     
 class Chapter(db.Model):
+    __table_args__ = (
+        db.Index('ix_chapter_subject_id', 'subject_id'),
+        db.Index('ix_chapter_updated_at', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    quiz_count = db.Column(db.Integer, default=0)  # counter cache of quizzes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship
     quizzes = db.relationship(
@@ -94,6 +127,13 @@ class Chapter(db.Model):
         return f'<Chapter {self.name}>'
 
 class Quiz(db.Model):
+    __table_args__ = (
+        db.Index('ix_quiz_subject_sequence', 'subject_id', 'sequence_number'),
+        db.Index('ix_quiz_chapter_id', 'chapter_id'),
+        db.Index('ix_quiz_prerequisite_quiz_id', 'prerequisite_quiz_id'),
+        db.Index('ix_quiz_updated_at', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -105,7 +145,11 @@ class Quiz(db.Model):
     passing_score = db.Column(db.Float, default=70.0)
     deadline = db.Column(db.DateTime, nullable=True)
     prerequisite_quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='SET NULL'), nullable=True)
+    full_paper = db.Column(db.Boolean, default=False)  # all questions on one page, single submission
+    question_version = db.Column(db.Integer, default=0)  # bumped whenever questions change
+    question_count = db.Column(db.Integer, default=0)  # counter cache of questions
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     prerequisite = db.relationship(
@@ -133,26 +177,11 @@ class Quiz(db.Model):
         """Check if quiz is unlocked for given user"""
         if not self.prerequisite_quiz_id:
             return True
-
-        prerequisite_attempts = QuizAttempt.query.filter_by(
-            user_id=user.id,
-            quiz_id=self.prerequisite_quiz_id,
-            completed=True
-        ).all()
-
-        for attempt in prerequisite_attempts:
-            if attempt.score >= self.prerequisite.passing_score:
-                return True
-        return False
+        return resolve_quiz_access([self], user)[self.id]['is_unlocked']
 
     def attempts_remaining_for_user(self, user):
         """Return number of attempts remaining"""
-        completed_attempts = QuizAttempt.query.filter_by(
-            user_id=user.id,
-            quiz_id=self.id,
-            completed=True
-        ).count()
-        return max(0, self.max_attempts - completed_attempts)
+        return resolve_quiz_access([self], user)[self.id]['attempts_remaining']
 
     def is_past_deadline(self):
         """Check if deadline has passed"""
@@ -164,6 +193,8 @@ class Quiz(db.Model):
         return f'<Quiz {self.name}>'
 
 class Question(db.Model):
+    __table_args__ = (db.Index('ix_question_quiz_id', 'quiz_id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
     marks = db.Column(db.Integer, default=1)
@@ -183,6 +214,15 @@ class Question(db.Model):
         return f'<Question {self.text[:50]}...>'
 
 class QuizAttempt(db.Model):
+    __table_args__ = (
+        # Every attempt/unlock check filters on (user, quiz[, completed])
+        db.Index('ix_quiz_attempt_user_quiz_completed', 'user_id', 'quiz_id', 'completed'),
+        db.Index('ix_quiz_attempt_user_completed_at', 'user_id', 'completed_at'),
+        db.Index('ix_quiz_attempt_quiz_id', 'quiz_id'),
+        # The expired-attempt sweep reads open attempts oldest first
+        db.Index('ix_quiz_attempt_completed_started_at', 'completed', 'started_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
         db.Integer, 
@@ -198,6 +238,12 @@ class QuizAttempt(db.Model):
     completed = db.Column(db.Boolean, default=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+
+    # Running score counters, updated as each answer is recorded
+    answered_count = db.Column(db.Integer, default=0)
+    correct_count = db.Column(db.Integer, default=0)
+    marks_earned = db.Column(db.Integer, default=0)
+    marks_possible = db.Column(db.Integer, default=0)
     
     # Relationships
     answers = db.relationship(
@@ -208,10 +254,64 @@ class QuizAttempt(db.Model):
         passive_deletes=True
     )
 
+    def record_answer(self, question, selected_option):
+        """Store an answer and add it to the running score counters"""
+        is_correct = selected_option == question.correct_option
+        db.session.add(UserAnswer(
+            attempt_id=self.id,
+            question_id=question.id,
+            selected_option=selected_option,
+            is_correct=is_correct
+        ))
+        marks = question.marks or 0
+        self.add_to_counters(1, int(is_correct), marks if is_correct else 0, marks)
+        return is_correct
+
+    def add_to_counters(self, answered, correct, marks_earned, marks_possible):
+        """Increment the counters in SQL so concurrent submissions don't lose updates"""
+        self.answered_count = db.func.coalesce(QuizAttempt.answered_count, 0) + answered
+        self.correct_count = db.func.coalesce(QuizAttempt.correct_count, 0) + correct
+        self.marks_earned = db.func.coalesce(QuizAttempt.marks_earned, 0) + marks_earned
+        self.marks_possible = db.func.coalesce(QuizAttempt.marks_possible, 0) + marks_possible
+
+    def finalize(self, completed_at=None):
+        """Mark the attempt completed and set its score; the rollups are updated by a job.
+
+        Returns False, leaving the attempt as it is, when something else
+        (the expired-attempt sweeper, a concurrent request) completed it first.
+        """
+        from app.utils import calculate_score
+        from app.snapshots import get_quiz_snapshot
+        from app.jobs import enqueue
+        db.session.flush()
+        total_marks = get_quiz_snapshot(self.quiz).total_marks
+        # Claimed with completed == False, like the sweeper, so the rollups count it once
+        claimed = db.session.execute(
+            db.update(QuizAttempt).where(QuizAttempt.id == self.id, QuizAttempt.completed == False)
+            .values(completed=True),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not claimed:
+            db.session.refresh(self)
+            if self.score is None:
+                # Completed before scores were stored
+                self.score = calculate_score(self, total_marks)
+            return False
+        self.completed = True
+        self.completed_at = completed_at or datetime.utcnow()
+        self.score = calculate_score(self, total_marks)
+        enqueue('record_attempt_completed', attempt_id=self.id)
+        return True
+
     def __repr__(self):
         return f'<QuizAttempt {self.user.username} - {self.quiz.name}>'
 
 class UserAnswer(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_answer_attempt_question', 'attempt_id', 'question_id'),
+        db.Index('ix_user_answer_question_id', 'question_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     attempt_id = db.Column(
         db.Integer, 
@@ -237,6 +337,180 @@ class UserAnswer(db.Model):
     def __repr__(self):
         return f'<UserAnswer {self.attempt_id} - Q{self.question_id}>'
 
+class SubjectStats(db.Model):
+    """Attempt rollup per subject, maintained incrementally by app.stats"""
+    subject_id = db.Column(
+        db.Integer,
+        db.ForeignKey('subject.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    attempt_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    score_sum = db.Column(db.Float, default=0.0, nullable=False)
+
+    @property
+    def average_score(self):
+        return self.score_sum / self.completed_count if self.completed_count else 0.0
+
+    def __repr__(self):
+        return f'<SubjectStats {self.subject_id}>'
+
+class QuizStats(db.Model):
+    """Attempt rollup per quiz, maintained incrementally by app.stats"""
+    quiz_id = db.Column(
+        db.Integer,
+        db.ForeignKey('quiz.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    subject_id = db.Column(db.Integer, nullable=False, index=True)
+    attempt_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    score_sum = db.Column(db.Float, default=0.0, nullable=False)
+
+    @property
+    def average_score(self):
+        return self.score_sum / self.completed_count if self.completed_count else 0.0
+
+    def __repr__(self):
+        return f'<QuizStats {self.quiz_id}>'
+
+class UserSubjectStats(db.Model):
+    """Per-user attempt rollup for each subject, maintained by app.stats"""
+    __table_args__ = (db.Index('ix_user_subject_stats_subject_id', 'subject_id'),)
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('user.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    subject_id = db.Column(
+        db.Integer,
+        db.ForeignKey('subject.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    attempt_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    score_sum = db.Column(db.Float, default=0.0, nullable=False)
+    best_score = db.Column(db.Float)
+    last_activity = db.Column(db.DateTime)
+
+    @property
+    def average_score(self):
+        return self.score_sum / self.completed_count if self.completed_count else 0.0
+
+    def __repr__(self):
+        return f'<UserSubjectStats {self.user_id} - {self.subject_id}>'
+
+class SearchDocument(db.Model):
+    """Searchable text of a subject, chapter, quiz or question, maintained by app.search"""
+    __table_args__ = (db.UniqueConstraint('kind', 'object_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)  # subject, chapter, quiz or question
+    object_id = db.Column(db.Integer, nullable=False)
+    subject_id = db.Column(db.Integer, index=True)
+    chapter_id = db.Column(db.Integer, index=True)
+    quiz_id = db.Column(db.Integer, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<SearchDocument {self.kind} {self.object_id}>'
+
+class ReplicaHeartbeat(db.Model):
+    """Single row stamped on the primary before each replica sync; its copy on the replica dates the replica's data"""
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)
+
+class CacheVersion(db.Model):
+    """Named counter bumped when cached content goes stale; fragment cache keys include it"""
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Total(db.Model):
+    """Named count of rows with no parent row to cache it on; kept by app.counters"""
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    """A queued unit of background work run by app.jobs workers; payload is JSON keyword arguments"""
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not before; pushed back on retry
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(64))
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+def resolve_quiz_access(quizzes, user):
+    """Compute access information for many quizzes for one user at once.
+
+    Returns a dict keyed by quiz id. Completed-attempt counts and best
+    scores come from a single grouped query over the quizzes and their
+    prerequisites, so the number of queries does not grow with the number
+    of quizzes.
+    """
+    quizzes = list(quizzes)
+    if not quizzes:
+        return {}
+
+    quiz_ids = {quiz.id for quiz in quizzes}
+    prerequisite_ids = {quiz.prerequisite_quiz_id for quiz in quizzes if quiz.prerequisite_quiz_id}
+
+    # Completed attempt count and best score per quiz (including prerequisites)
+    attempt_rows = db.session.query(
+        QuizAttempt.quiz_id,
+        db.func.count(QuizAttempt.id),
+        db.func.max(QuizAttempt.score)
+    ).filter(
+        QuizAttempt.user_id == user.id,
+        QuizAttempt.quiz_id.in_(quiz_ids | prerequisite_ids),
+        QuizAttempt.completed == True
+    ).group_by(QuizAttempt.quiz_id).all()
+    completed_counts = {quiz_id: count for quiz_id, count, _ in attempt_rows}
+    best_scores = {quiz_id: best for quiz_id, _, best in attempt_rows}
+
+    # Passing scores of prerequisites that are not part of this batch
+    passing_scores = {quiz.id: quiz.passing_score for quiz in quizzes}
+    missing_ids = prerequisite_ids - quiz_ids
+    if missing_ids:
+        passing_scores.update(db.session.query(Quiz.id, Quiz.passing_score).filter(
+            Quiz.id.in_(missing_ids)
+        ).all())
+
+    access = {}
+    for quiz in quizzes:
+        if quiz.prerequisite_quiz_id:
+            best_score = best_scores.get(quiz.prerequisite_quiz_id)
+            passing_score = passing_scores.get(quiz.prerequisite_quiz_id)
+            is_unlocked = (best_score is not None and passing_score is not None
+                           and best_score >= passing_score)
+        else:
+            is_unlocked = True
+        attempts_remaining = max(0, quiz.max_attempts - completed_counts.get(quiz.id, 0))
+        is_past_deadline = quiz.is_past_deadline()
+
+        access[quiz.id] = {
+            'quiz': quiz,
+            'is_unlocked': is_unlocked,
+            'attempts_remaining': attempts_remaining,
+            'is_past_deadline': is_past_deadline,
+            'question_count': quiz.question_count or 0,
+            'can_attempt': is_unlocked and attempts_remaining > 0 and not is_past_deadline
+        }
+    return access
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
\ No newline at end of file
+    # A cached (id, username, is_admin) principal rather than the full row
+    return load_principal(int(user_id))
\ No newline at end of file
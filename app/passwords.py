@@ -0,0 +1,121 @@
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt'
+DEFAULT_SALT_LENGTH = 16
+
+
+class HashPoolBusy(Exception):
+    """Raised when every hashing slot is taken for longer than PASSWORD_HASH_WAIT_SECONDS"""
+
+
+class HashPool:
+    """A bounded executor for password hashing with admission control.
+
+    At most workers hashes run at once and at most queue more wait for a
+    worker; a caller that can't get one of those slots within wait_seconds
+    gets HashPoolBusy instead of piling more CPU work onto the server.
+    The executor is created on first use, and a forked child starts over
+    with no executor and fresh locks: threads don't survive a fork, so an
+    executor inherited from a preloading master would never run anything.
+    """
+
+    def __init__(self, kind='thread', workers=4, queue=16, wait_seconds=5.0):
+        if kind not in ('thread', 'process'):
+            raise ValueError("PASSWORD_HASH_POOL must be 'thread' or 'process'")
+        self.kind = kind
+        self.workers = workers
+        self.wait_seconds = wait_seconds
+        self.queue = queue
+        self._reset()
+        _pools.add(self)
+
+    def _reset(self):
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue)
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                executor_class = ThreadPoolExecutor if self.kind == 'thread' else ProcessPoolExecutor
+                self.executor = executor_class(max_workers=self.workers)
+            return self.executor
+
+    def run(self, function, *args):
+        if not self.slots.acquire(timeout=self.wait_seconds):
+            raise HashPoolBusy()
+        try:
+            return self._executor().submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+
+_pools = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool._reset()
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def init_passwords(app):
+    app.extensions['qna_password_pool'] = HashPool(
+        kind=app.config.get('PASSWORD_HASH_POOL', 'thread'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 4),
+        queue=app.config.get('PASSWORD_HASH_QUEUE', 16),
+        wait_seconds=app.config.get('PASSWORD_HASH_WAIT_SECONDS', 5.0)
+    )
+
+
+def _settings():
+    if not has_app_context():
+        return DEFAULT_METHOD, DEFAULT_SALT_LENGTH, None
+    config = current_app.config
+    return (config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+            config.get('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH),
+            current_app.extensions.get('qna_password_pool'))
+
+
+def _run(pool, function, *args):
+    return pool.run(function, *args) if pool is not None else function(*args)
+
+
+def hash_password(password):
+    """Hash with the configured method on the hashing pool; may raise HashPoolBusy"""
+    method, salt_length, pool = _settings()
+    return _run(pool, generate_password_hash, password, method, salt_length)
+
+
+def verify_password(pwhash, password):
+    """Check a password on the hashing pool; may raise HashPoolBusy"""
+    pool = _settings()[2]
+    return _run(pool, check_password_hash, pwhash, password)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # Werkzeug expands defaults into the stored prefix ('scrypt' -> 'scrypt:32768:8:1')
+    return generate_password_hash('', method, 1).split('$', 1)[0]
+
+
+def needs_rehash(pwhash):
+    """Whether pwhash was made with other hash parameters than the configured ones"""
+    method, salt_length, _ = _settings()
+    prefix, _, rest = pwhash.partition('$')
+    salt = rest.partition('$')[0]
+    return prefix != _method_prefix(method) or len(salt) != salt_length
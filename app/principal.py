@@ -0,0 +1,94 @@
+import threading
+import time
+from flask import current_app
+from flask_login import UserMixin
+
+
+class Principal(UserMixin):
+    """The logged-in user as flask-login sees it: just the columns checked on every request.
+
+    Views that need the rest of the row (the profile page) load the User
+    themselves.
+    """
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+
+    def __repr__(self):
+        return f'<Principal {self.username}>'
+
+
+class PrincipalCache:
+    """Per-process cache of principals by user id, each entry kept for ttl seconds"""
+
+    def __init__(self, ttl=30, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[user_id]
+                return None
+            return entry[1]
+
+    def put(self, principal):
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                now = time.monotonic()
+                self.entries = {key: entry for key, entry in self.entries.items() if entry[0] >= now}
+                # Still full of live entries: drop the oldest half
+                if len(self.entries) >= self.max_size:
+                    keys = list(self.entries)
+                    for key in keys[:len(keys) // 2]:
+                        del self.entries[key]
+            self.entries[principal.id] = (time.monotonic() + self.ttl, principal)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+
+def init_principals(app):
+    app.extensions['qna_principals'] = PrincipalCache(
+        ttl=app.config.get('USER_CACHE_TTL_SECONDS', 30),
+        max_size=app.config.get('USER_CACHE_SIZE', 10000)
+    )
+
+
+def load_principal(user_id):
+    """The principal for user_id, from the cache or one narrow query.
+
+    None if the user is gone or has no password hash, which is how a user
+    queued for deletion is marked, so their open sessions end at once.
+    """
+    cache = current_app.extensions['qna_principals']
+    principal = cache.get(user_id)
+    if principal is not None:
+        return principal
+    from app.models import db, User
+    row = db.session.query(User.id, User.username, User.is_admin).filter(
+        User.id == user_id, User.password_hash.isnot(None)
+    ).first()
+    if row is None:
+        return None
+    principal = Principal(*row)
+    if cache.ttl > 0:
+        cache.put(principal)
+    return principal
+
+
+def invalidate_principal(user_id):
+    """Forget a cached principal after its user is changed or deleted.
+
+    Only this process's cache is cleared; other worker processes pick the
+    change up when their entry expires after USER_CACHE_TTL_SECONDS.
+    """
+    current_app.extensions['qna_principals'].discard(user_id)
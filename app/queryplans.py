@@ -0,0 +1,171 @@
+import os
+import re
+import shutil
+import tempfile
+from sqlalchemy import event
+
+# Pages whose queries must stay on indexes, grouped by the account that visits them
+STUDENT_PAGES = [
+    '/dashboard',
+    '/dashboard?q=algebra',
+    '/subject/{subject_id}',
+    '/subject/{subject_id}/quizzes',
+    '/quiz/{quiz_id}/attempt',
+    ('POST', '/quiz/{quiz_id}/attempt'),
+    ('POST', '/quiz/{quiz_id}/attempt'),
+    ('POST', '/quiz/{quiz_id}/attempt'),  # answers the last of the three questions
+    '/attempt/{attempt_id}/result',
+    '/performance',
+    '/api/subjects',
+    '/api/subjects?embed=chapters,quizzes',
+]
+ADMIN_PAGES = [
+    '/admin/dashboard',
+    '/admin/dashboard?q=algebra',
+    '/admin/subject/{subject_id}',
+    '/admin/chapter/{chapter_id}/view',
+    '/admin/quiz/{quiz_id}/view',
+    '/admin/statistics',
+    '/admin/user-statistics',
+    '/admin/user-statistics?sort=attempts',
+    '/admin/user-statistics?sort=average',
+    '/admin/user-statistics?q=stu',
+    '/admin/user-statistics/{user_id}',
+    '/admin/teachers',
+]
+
+# Full scans that are the point of the query: listing or aggregating a whole
+# (small, or paginated) table. Keyed by table, or by (page, table) when only
+# one page may scan it.
+EXPECTED_SCANS = {
+    'subject': 'dashboards and the API list every subject',
+    'teacher': 'the teacher page lists every teacher',
+    'subject_stats': 'admin statistics charts every subject',
+    ('GET /admin/statistics', 'quiz'): 'the question total sums the per-quiz counter caches',
+    ('GET /admin/user-statistics?sort=average', 'user'): 'sorting by average ranks every user',
+}
+
+# "SCAN t" reads every row of t; "SCAN t USING [COVERING] INDEX i" walks an
+# index in order, which is how ORDER BY ... LIMIT pages are meant to run
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def full_scans(plan, aliases):
+    """Tables read by a full table scan, from EXPLAIN QUERY PLAN detail strings"""
+    tables = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match:
+            name = aliases.get(match.group(1), match.group(1))
+            if not name.startswith(('anon_', 'subquery')):
+                tables.append(name)
+    return tables
+
+
+def _expected(page, table):
+    return table in EXPECTED_SCANS or (page, table) in EXPECTED_SCANS
+
+
+def _seed(db):
+    from app.models import Teacher, Subject, Chapter, Quiz, Question, User
+    from app import search, stats
+    teacher = Teacher(name='Plan Teacher')
+    db.session.add(teacher)
+    db.session.flush()
+    subject = Subject(name='Algebra', description='Plan subject', teacher_id=teacher.id)
+    db.session.add(subject)
+    db.session.flush()
+    chapter = Chapter(name='Linear equations', description='Plan chapter', subject_id=subject.id)
+    db.session.add(chapter)
+    db.session.flush()
+    quiz = Quiz(name='Algebra basics', description='Plan quiz', time_limit=10,
+                subject_id=subject.id, chapter_id=chapter.id)
+    db.session.add(quiz)
+    db.session.flush()
+    for i in range(3):
+        db.session.add(Question(text=f'Question {i}', option1='a', option2='b', option3='c',
+                                option4='d', correct_option=1, marks=1, quiz_id=quiz.id))
+    student = User(username='plan-student')
+    student.set_password('plan-student')
+    db.session.add(student)
+    db.session.flush()
+    search.rebuild()
+    stats.rebuild()
+    db.session.commit()
+    return dict(subject_id=subject.id, chapter_id=chapter.id, quiz_id=quiz.id, user_id=student.id)
+
+
+def check_query_plans(config):
+    """Visit the hot pages of a throwaway SQLite copy of the schema and
+    EXPLAIN QUERY PLAN every SELECT they issue. config is the running
+    app's config; only the database is swapped out.
+
+    Returns a list of (page, table, statement) for full scans not listed in
+    EXPECTED_SCANS.
+    """
+    from app import create_app
+    from app.models import db
+
+    workdir = tempfile.mkdtemp(prefix='qna-plans-')
+
+    PlanConfig = type('PlanConfig', (), dict(
+        config,
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(workdir, 'plans.db'),
+        SQLALCHEMY_BINDS={},
+        REPLICA_DATABASE_URL=None,
+        INIT_DB_ON_STARTUP=True,
+        WTF_CSRF_ENABLED=False,
+        TESTING=True
+    ))
+
+    try:
+        app = create_app(PlanConfig)
+        statements = []
+        with app.app_context():
+            ids = _seed(db)
+            engine = db.engine
+
+            @event.listens_for(engine, 'before_cursor_execute')
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if not executemany and statement.lstrip().upper().startswith('SELECT'):
+                    statements.append((capture.page, statement, parameters))
+            capture.page = None
+
+            client = app.test_client()
+            client.post('/login', data={'username': 'plan-student', 'password': 'plan-student'})
+            _visit(client, capture, STUDENT_PAGES, ids)
+            client.get('/logout')
+            client.post('/quizmaster/login', data={'username': app.config['QUIZMASTER_USERNAME'],
+                                                   'password': app.config['QUIZMASTER_PASSWORD']})
+            _visit(client, capture, ADMIN_PAGES, ids)
+            event.remove(engine, 'before_cursor_execute', capture)
+
+            offenders = []
+            seen = set()
+            with engine.connect() as connection:
+                for page, statement, parameters in statements:
+                    if statement in seen:
+                        continue
+                    seen.add(statement)
+                    plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                    aliases = dict(re.findall(r'\b(\w+) AS (\w+)\b', statement))
+                    aliases = {alias: table for table, alias in aliases.items()}
+                    for table in full_scans([row[-1] for row in plan], aliases):
+                        if not _expected(page, table):
+                            offenders.append((page, table, statement))
+        return offenders
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _visit(client, capture, pages, ids):
+    for page in pages:
+        method, url = page if isinstance(page, tuple) else ('GET', page)
+        url = url.format(attempt_id=1, **ids)
+        capture.page = f'{method} {url}'
+        if method == 'POST':
+            response = client.post(url, data={'option': '1', 'submit': 'Next'})
+        else:
+            response = client.get(url)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}')
@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, has_app_context, session
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to the read replica in requests that opted in.
+
+    Flushes, SELECT ... FOR UPDATE and every non-SELECT statement stay on
+    the primary, so a replica-routed view can still write.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and clause._for_update_arg is None
+                and has_app_context() and g.get('read_replica')):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_write(db_session, flush_context):
+    if has_app_context():
+        g.db_wrote = True
+
+
+class ReplicaState:
+    """Last known freshness of the replica, rechecked at most every REPLICA_CHECK_SECONDS"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.checked_at = 0.0
+        self.as_of = None  # Unix time the replica's data is current to; None when unusable
+
+    def mark_down(self):
+        with self.lock:
+            self.checked_at = time.monotonic()
+            self.as_of = None
+
+    def reset(self):
+        with self.lock:
+            self.checked_at = 0.0
+
+
+def _state(app):
+    return app.extensions['qna_replica']
+
+
+def _replica_as_of(connection):
+    if connection.dialect.name == 'postgresql':
+        # A streaming standby that has replayed everything it received is current now
+        as_of = connection.execute(text(
+            'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+            'THEN now() ELSE pg_last_xact_replay_timestamp() END'
+        )).scalar()
+        return as_of.timestamp() if as_of is not None else None
+    beat_at = connection.execute(text('SELECT beat_at FROM replica_heartbeat WHERE id = 1')).scalar()
+    if beat_at is None:
+        return None
+    if isinstance(beat_at, str):
+        beat_at = datetime.fromisoformat(beat_at)
+    return beat_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def replica_as_of():
+    """Unix time the replica is current to, or None if it is unreachable or has no heartbeat"""
+    app = current_app._get_current_object()
+    state = _state(app)
+    with state.lock:
+        if time.monotonic() - state.checked_at < app.config['REPLICA_CHECK_SECONDS']:
+            return state.as_of
+        from app.models import db
+        try:
+            with db.engines[REPLICA_BIND].connect() as connection:
+                state.as_of = _replica_as_of(connection)
+        except Exception as e:
+            app.logger.warning('Read replica unavailable, reading from the primary: %s', e)
+            state.as_of = None
+        state.checked_at = time.monotonic()
+        return state.as_of
+
+
+def use_replica():
+    """Route this request's SELECTs to the replica if it is fresh enough.
+
+    Falls back to the primary when no replica is configured, it is
+    unreachable, it lags more than REPLICA_MAX_LAG_SECONDS, or it predates
+    this client's own last write.
+    """
+    if REPLICA_BIND not in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        return False
+    # Load the logged-in user from the primary before any reads are rerouted
+    current_user._get_current_object()
+    as_of = replica_as_of()
+    if as_of is None:
+        return False
+    if time.time() - as_of > current_app.config['REPLICA_MAX_LAG_SECONDS']:
+        return False
+    if session.get('db_written_at', 0) > as_of:
+        return False
+    g.read_replica = True
+    return True
+
+
+def read_replica(view):
+    """Serve a read-only view from the read replica when it is usable"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        use_replica()
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def init_replica(app, db):
+    """Set up replica routing; a no-op unless REPLICA_DATABASE_URL is set"""
+    app.extensions['qna_replica'] = ReplicaState()
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @event.listens_for(db.engines[REPLICA_BIND], 'handle_error')
+    def replica_failed(context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            _state(app).mark_down()
+
+    @app.after_request
+    def remember_write(response):
+        # Reads of a client that just wrote stay on the primary until the replica catches up
+        if g.get('db_wrote'):
+            session['db_written_at'] = time.time()
+        return response
+
+
+def sync_sqlite_replica():
+    """Copy the primary SQLite database over the replica file with the backup API.
+
+    The heartbeat is stamped first, so the copy carries the time it was
+    taken and the staleness check can tell how old it is.
+    """
+    from app.models import db, ReplicaHeartbeat
+    primary = db.engines[None]
+    replica = db.engines[REPLICA_BIND]
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise ValueError('sync-replica copies SQLite databases only; use your database\'s replication otherwise')
+
+    heartbeat = db.session.get(ReplicaHeartbeat, 1) or ReplicaHeartbeat(id=1)
+    heartbeat.beat_at = datetime.utcnow()
+    db.session.add(heartbeat)
+    db.session.commit()
+
+    source = primary.raw_connection()
+    try:
+        target = sqlite3.connect(replica.url.database)
+        try:
+            source.driver_connection.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    replica.dispose()
+    _state(current_app._get_current_object()).reset()
+    return heartbeat.beat_at
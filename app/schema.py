@@ -0,0 +1,93 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import inspect, text
+from app.models import db, User, Subject, Chapter, Quiz
+from app import counters, search
+
+
+def _column_ddl(column, dialect):
+    ddl = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}'
+    if column.default is not None and column.default.is_scalar:
+        default = column.default.arg
+        if isinstance(default, bool):
+            default = int(default)
+        ddl += f' DEFAULT {default!r}' if isinstance(default, str) else f' DEFAULT {default}'
+    return ddl
+
+
+def initialize():
+    """Create the missing tables, the full-text search index and the quizmaster account.
+
+    Returns a line per change. create_app calls this on every start unless
+    INIT_DB_ON_STARTUP is off; `flask init-db` runs it on its own.
+    """
+    changes = []
+    existing_tables = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    changes += [f'created table {table.name}' for table in db.metadata.sorted_tables
+                if table.name not in existing_tables]
+    search.create_fts_index()
+
+    username = current_app.config['QUIZMASTER_USERNAME']
+    # Only the id is selected so older databases still start for `flask upgrade-db`
+    if db.session.query(User.id).filter_by(username=username).scalar() is None:
+        quizmaster = User(username=username, is_admin=True)
+        quizmaster.set_password(current_app.config['QUIZMASTER_PASSWORD'])
+        db.session.add(quizmaster)
+        db.session.commit()
+        changes.append(f'created quizmaster account {username}')
+    return changes
+
+
+def upgrade():
+    """Bring an existing database up to the current models; yields a line per change.
+
+    Creates missing tables, adds missing columns (ALTER TABLE ADD COLUMN),
+    creates missing indexes, then fills in values that new columns need:
+    updated_at for the API validators and the counter caches. Safe to run
+    repeatedly.
+    """
+    engine = db.engine
+    dialect = engine.dialect
+    existing_tables = set(inspect(engine).get_table_names())
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            yield f'created table {table.name}'
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    connection.execute(text(
+                        f'ALTER TABLE {dialect.identifier_preparer.quote(table.name)} '
+                        f'ADD COLUMN {_column_ddl(column, dialect)}'
+                    ))
+                    yield f'added column {table.name}.{column.name}'
+
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=connection)
+                    yield f'created index {index.name}'
+
+    for model in (Subject, Chapter, Quiz):
+        updated = model.query.filter(model.updated_at.is_(None)).update(
+            {model.updated_at: db.func.coalesce(model.created_at, datetime.utcnow())},
+            synchronize_session=False
+        )
+        if updated:
+            yield f'filled updated_at of {updated} {model.__tablename__} row(s)'
+    repaired = counters.check(repair=True)
+    if repaired:
+        yield f'repaired {len(repaired)} counter cache(s)'
+    db.session.commit()
+
+    if dialect.name == 'sqlite':
+        # Refresh the planner statistics for the new indexes
+        with engine.begin() as connection:
+            connection.execute(text('PRAGMA optimize'))
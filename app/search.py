@@ -0,0 +1,204 @@
+import re
+from sqlalchemy import text, case, and_, or_
+from app.models import db, Subject, Chapter, Quiz, Question, SearchDocument
+
+# Kinds students may search; question text is only searchable by admins
+STUDENT_KINDS = ('subject', 'chapter', 'quiz')
+ALL_KINDS = STUDENT_KINDS + ('question',)
+
+RESULTS_PER_PAGE = 20
+
+FTS_TABLE = 'search_document_fts'
+
+_FTS_SETUP = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, body, content='search_document', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    f"CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    f"CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+_fts_available = {}
+
+
+def create_fts_index():
+    """Create the FTS5 index and its sync triggers when running on SQLite.
+
+    Other backends, or SQLite builds without FTS5, fall back to LIKE
+    queries over the search_document table.
+    """
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        _fts_available[engine.url] = False
+        return False
+    try:
+        with engine.begin() as connection:
+            for statement in _FTS_SETUP:
+                connection.execute(text(statement))
+    except Exception:
+        _fts_available[engine.url] = False
+        return False
+    _fts_available[engine.url] = True
+    return True
+
+
+def fts_enabled():
+    engine = db.engine
+    if engine.url not in _fts_available:
+        if engine.dialect.name != 'sqlite':
+            _fts_available[engine.url] = False
+        else:
+            found = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ), {'name': FTS_TABLE}).first()
+            _fts_available[engine.url] = found is not None
+    return _fts_available[engine.url]
+
+
+def _document_values(kind, obj):
+    if kind == 'subject':
+        return dict(subject_id=obj.id, chapter_id=None, quiz_id=None,
+                    title=obj.name, body=obj.description)
+    if kind == 'chapter':
+        return dict(subject_id=obj.subject_id, chapter_id=obj.id, quiz_id=None,
+                    title=obj.name, body=obj.description)
+    if kind == 'quiz':
+        return dict(subject_id=obj.subject_id, chapter_id=obj.chapter_id, quiz_id=obj.id,
+                    title=obj.name, body=obj.description)
+    quiz = obj.quiz or Quiz.query.get(obj.quiz_id)
+    return dict(subject_id=quiz.subject_id, chapter_id=quiz.chapter_id, quiz_id=obj.quiz_id,
+                title=obj.text[:200],
+                body='\n'.join([obj.text, obj.option1, obj.option2, obj.option3, obj.option4]))
+
+
+def index(kind, obj):
+    """Add or refresh the search document of obj (call after it has an id)"""
+    values = _document_values(kind, obj)
+    document = SearchDocument.query.filter_by(kind=kind, object_id=obj.id).first()
+    if document is None:
+        document = SearchDocument(kind=kind, object_id=obj.id)
+        db.session.add(document)
+    for name, value in values.items():
+        setattr(document, name, value)
+    if kind == 'quiz':
+        # Questions carry their quiz's chapter so chapter deletes can find them
+        SearchDocument.query.filter_by(kind='question', quiz_id=obj.id).update(
+            {'chapter_id': obj.chapter_id}, synchronize_session=False
+        )
+
+
+def remove(kind, object_id):
+    SearchDocument.query.filter_by(kind=kind, object_id=object_id).delete(synchronize_session=False)
+
+
+def remove_subject(subject_id):
+    SearchDocument.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+
+
+def remove_chapter(chapter_id):
+    """Remove a chapter together with its quizzes and their questions"""
+    SearchDocument.query.filter_by(chapter_id=chapter_id).delete(synchronize_session=False)
+
+
+def remove_quiz(quiz_id):
+    """Remove a quiz together with its questions"""
+    SearchDocument.query.filter_by(quiz_id=quiz_id).delete(synchronize_session=False)
+
+
+def _terms(query):
+    return re.findall(r'\w+', query, re.UNICODE)[:10]
+
+
+def search(query, kinds=STUDENT_KINDS, page=1, per_page=RESULTS_PER_PAGE):
+    """Ranked search hits for query; returns (hits, has_next).
+
+    Each hit has kind, object_id, subject_id, quiz_id, title and snippet.
+    """
+    terms = _terms(query)
+    if not terms:
+        return [], False
+    offset = (max(page, 1) - 1) * per_page
+
+    if fts_enabled():
+        # Every term must match, as a prefix; titles weigh ten times the body
+        match = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        kind_params = {f'kind{i}': kind for i, kind in enumerate(kinds)}
+        kind_list = ', '.join(f':{name}' for name in kind_params)
+        rows = db.session.execute(text(
+            f"SELECT d.kind, d.object_id, d.subject_id, d.quiz_id, d.title, "
+            f"snippet({FTS_TABLE}, 1, '', '', '...', 16) AS snippet "
+            f"FROM {FTS_TABLE} JOIN search_document AS d ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match AND d.kind IN ({kind_list}) "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+        ), dict(kind_params, match=match, limit=per_page + 1, offset=offset)).all()
+    else:
+        conditions = [
+            or_(SearchDocument.title.ilike(f'%{term}%'), SearchDocument.body.ilike(f'%{term}%'))
+            for term in terms
+        ]
+        title_hit = case((SearchDocument.title.ilike(f'%{terms[0]}%'), 0), else_=1)
+        rows = db.session.query(
+            SearchDocument.kind,
+            SearchDocument.object_id,
+            SearchDocument.subject_id,
+            SearchDocument.quiz_id,
+            SearchDocument.title,
+            db.func.substr(db.func.coalesce(SearchDocument.body, ''), 1, 120).label('snippet')
+        ).filter(
+            SearchDocument.kind.in_(kinds),
+            and_(*conditions)
+        ).order_by(title_hit, SearchDocument.title
+        ).offset(offset).limit(per_page + 1).all()
+
+    return rows[:per_page], len(rows) > per_page
+
+
+def _sources():
+    """INSERT ... SELECT sources producing the search documents of each kind"""
+    return {
+        'subject': db.session.query(db.literal('subject'), Subject.id, Subject.id, db.null(), db.null(),
+                                    Subject.name, Subject.description),
+        'chapter': db.session.query(db.literal('chapter'), Chapter.id, Chapter.subject_id, Chapter.id, db.null(),
+                                    Chapter.name, Chapter.description),
+        'quiz': db.session.query(db.literal('quiz'), Quiz.id, Quiz.subject_id, Quiz.chapter_id, Quiz.id,
+                                 Quiz.name, Quiz.description),
+        'question': db.session.query(db.literal('question'), Question.id, Quiz.subject_id, Quiz.chapter_id,
+                                     Question.quiz_id, db.func.substr(Question.text, 1, 200),
+                                     Question.text + '\n' + Question.option1 + '\n' + Question.option2
+                                     + '\n' + Question.option3 + '\n' + Question.option4
+                                     ).join(Quiz, Question.quiz_id == Quiz.id),
+    }
+
+
+_SOURCE_IDS = {'subject': Subject.id, 'chapter': Chapter.id, 'quiz': Quiz.id, 'question': Question.id}
+_COLUMNS = ['kind', 'object_id', 'subject_id', 'chapter_id', 'quiz_id', 'title', 'body']
+
+
+def index_ids(kind, ids):
+    """Set-based index() for many objects of one kind, e.g. after a bulk insert or update"""
+    ids = list(ids)
+    if not ids:
+        return
+    SearchDocument.query.filter(
+        SearchDocument.kind == kind, SearchDocument.object_id.in_(ids)
+    ).delete(synchronize_session=False)
+    source = _sources()[kind].filter(_SOURCE_IDS[kind].in_(ids))
+    db.session.execute(db.insert(SearchDocument).from_select(_COLUMNS, source))
+    if kind == 'quiz':
+        chapter_id = db.select(Quiz.chapter_id).where(Quiz.id == SearchDocument.quiz_id).scalar_subquery()
+        SearchDocument.query.filter(
+            SearchDocument.kind == 'question', SearchDocument.quiz_id.in_(ids)
+        ).update({'chapter_id': chapter_id}, synchronize_session=False)
+
+
+def rebuild():
+    """Re-create every search document from the content tables"""
+    SearchDocument.query.delete(synchronize_session=False)
+    for source in _sources().values():
+        db.session.execute(db.insert(SearchDocument).from_select(_COLUMNS, source))
+    if fts_enabled():
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
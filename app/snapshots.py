@@ -0,0 +1,88 @@
+from collections import namedtuple
+from app.models import db, Question, Quiz
+
+# Immutable, compact view of a question. Field names match the Question model
+# so templates can use either interchangeably.
+QuestionSnapshot = namedtuple('QuestionSnapshot', [
+    'id', 'text', 'option1', 'option2', 'option3', 'option4', 'correct_option', 'marks'
+])
+
+
+class QuizSnapshot:
+    """All questions of one quiz at a given question_version"""
+    __slots__ = ('quiz_id', 'version', 'questions', 'by_id', 'total_marks')
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.questions = tuple(questions)
+        self.by_id = {question.id: question for question in self.questions}
+        self.total_marks = sum(question.marks or 0 for question in self.questions)
+
+    def next_unanswered(self, answered_question_ids):
+        for question in self.questions:
+            if question.id not in answered_question_ids:
+                return question
+        return None
+
+    def __len__(self):
+        return len(self.questions)
+
+
+_snapshots = {}
+
+
+def total_marks(quiz_ids):
+    """Total marks of each quiz in quiz_ids, in one grouped query; quizzes without questions are left out"""
+    return dict(db.session.query(
+        Question.quiz_id, db.func.sum(db.func.coalesce(Question.marks, 0))
+    ).filter(Question.quiz_id.in_(quiz_ids)).group_by(Question.quiz_id).all())
+
+
+def get_quiz_snapshot(quiz):
+    """Return the cached snapshot for quiz, rebuilding it if its version moved on.
+
+    The version lives on the Quiz row, which callers have already loaded,
+    so a fresh snapshot costs no extra query and edits made through any
+    worker process are picked up on the next request.
+    """
+    version = quiz.question_version or 0
+    snapshot = _snapshots.get(quiz.id)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    rows = db.session.query(
+        Question.id, Question.text,
+        Question.option1, Question.option2, Question.option3, Question.option4,
+        Question.correct_option, Question.marks
+    ).filter(Question.quiz_id == quiz.id).order_by(Question.id).all()
+    snapshot = QuizSnapshot(quiz.id, version, (QuestionSnapshot(*row) for row in rows))
+    _snapshots[quiz.id] = snapshot
+    return snapshot
+
+
+def invalidate_quiz_snapshot(quiz):
+    """Bump the quiz's question version and drop the local snapshot.
+
+    Must be called before the session is committed so the new version is
+    saved together with the question change. The increment runs in SQL
+    at flush, so concurrent edits of the same quiz each move it on.
+    """
+    quiz.question_version = db.func.coalesce(Quiz.question_version, 0) + 1
+    _snapshots.pop(quiz.id, None)
+
+
+def invalidate_quiz_snapshots(quiz_ids):
+    """invalidate_quiz_snapshot for many quizzes at once, bumping the versions in SQL"""
+    quiz_ids = list(quiz_ids)
+    if not quiz_ids:
+        return
+    db.session.execute(db.update(Quiz).where(Quiz.id.in_(quiz_ids)).values(
+        question_version=db.func.coalesce(Quiz.question_version, 0) + 1
+    ))
+    for quiz_id in quiz_ids:
+        _snapshots.pop(quiz_id, None)
+
+
+def discard_quiz_snapshot(quiz_id):
+    _snapshots.pop(quiz_id, None)
@@ -0,0 +1,254 @@
+from sqlalchemy import case
+from app.models import db, Subject, Quiz, QuizAttempt, SubjectStats, QuizStats, UserSubjectStats
+
+
+def _bump(model, keys, deltas, sets=None):
+    """Add deltas to a rollup row, creating the row if it doesn't exist yet.
+
+    sets holds extra (column -> SQL expression) assignments for the update
+    and the plain values to use when the row has to be created.
+    """
+    sets = sets or {}
+    values = {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items()}
+    values.update({getattr(model, name): expression for name, (expression, _) in sets.items()})
+    updated = db.session.query(model).filter_by(**keys).update(values, synchronize_session=False)
+    if not updated:
+        row = model(**keys)
+        for name, delta in deltas.items():
+            setattr(row, name, delta)
+        for name, (_, initial) in sets.items():
+            setattr(row, name, initial)
+        db.session.add(row)
+
+
+def _bump_quiz(quiz_id, subject_id, deltas):
+    _bump(QuizStats, {'quiz_id': quiz_id}, deltas, {'subject_id': (subject_id, subject_id)})
+    _bump(SubjectStats, {'subject_id': subject_id}, deltas)
+
+
+def create_rollups(subject_id=None, quiz=None):
+    """Create empty rollup rows for a newly added subject or quiz"""
+    if subject_id is not None:
+        db.session.add(SubjectStats(subject_id=subject_id, attempt_count=0, completed_count=0, score_sum=0.0))
+    if quiz is not None:
+        db.session.add(QuizStats(quiz_id=quiz.id, subject_id=quiz.subject_id,
+                                 attempt_count=0, completed_count=0, score_sum=0.0))
+
+
+def create_rollups_many(subject_ids=(), quizzes=()):
+    """Bulk create_rollups for (quiz id, subject id) pairs and subject ids"""
+    if subject_ids:
+        db.session.execute(db.insert(SubjectStats), [
+            {'subject_id': subject_id, 'attempt_count': 0, 'completed_count': 0, 'score_sum': 0.0}
+            for subject_id in subject_ids
+        ])
+    if quizzes:
+        db.session.execute(db.insert(QuizStats), [
+            {'quiz_id': quiz_id, 'subject_id': subject_id,
+             'attempt_count': 0, 'completed_count': 0, 'score_sum': 0.0}
+            for quiz_id, subject_id in quizzes
+        ])
+
+
+def record_attempt_started(attempt, quiz):
+    _bump_quiz(quiz.id, quiz.subject_id, {'attempt_count': 1})
+    _bump(UserSubjectStats, {'user_id': attempt.user_id, 'subject_id': quiz.subject_id},
+          {'attempt_count': 1},
+          {'last_activity': (attempt.started_at, attempt.started_at)})
+
+
+def record_attempt_completed(attempt):
+    quiz = attempt.quiz
+    score = attempt.score or 0.0
+    _bump_quiz(quiz.id, quiz.subject_id, {'completed_count': 1, 'score_sum': score})
+
+    best_score = case(
+        (db.func.coalesce(UserSubjectStats.best_score, -1.0) < score, score),
+        else_=UserSubjectStats.best_score
+    )
+    _bump(UserSubjectStats, {'user_id': attempt.user_id, 'subject_id': quiz.subject_id},
+          {'completed_count': 1, 'score_sum': score},
+          {'best_score': (best_score, score),
+           'last_activity': (attempt.completed_at, attempt.completed_at)})
+
+
+def record_attempts_completed(attempts):
+    """Bulk record_attempt_completed for dicts of user_id, quiz_id, subject_id, score and completed_at"""
+    quizzes, user_subjects = {}, {}
+    for attempt in attempts:
+        score = attempt['score'] or 0.0
+        quiz = quizzes.setdefault((attempt['quiz_id'], attempt['subject_id']), [0, 0.0])
+        quiz[0] += 1
+        quiz[1] += score
+        key = (attempt['user_id'], attempt['subject_id'])
+        totals = user_subjects.get(key)
+        if totals is None:
+            user_subjects[key] = [1, score, score, attempt['completed_at']]
+        else:
+            totals[0] += 1
+            totals[1] += score
+            totals[2] = max(totals[2], score)
+            totals[3] = max(totals[3], attempt['completed_at'])
+
+    for (quiz_id, subject_id), (count, score_sum) in quizzes.items():
+        _bump_quiz(quiz_id, subject_id, {'completed_count': count, 'score_sum': score_sum})
+    for (user_id, subject_id), (count, score_sum, best, last_activity) in user_subjects.items():
+        best_score = case(
+            (db.func.coalesce(UserSubjectStats.best_score, -1.0) < best, best),
+            else_=UserSubjectStats.best_score
+        )
+        # Swept attempts complete in the past, so last_activity only moves forward
+        latest = case(
+            (db.or_(UserSubjectStats.last_activity.is_(None), UserSubjectStats.last_activity < last_activity),
+             last_activity),
+            else_=UserSubjectStats.last_activity
+        )
+        _bump(UserSubjectStats, {'user_id': user_id, 'subject_id': subject_id},
+              {'completed_count': count, 'score_sum': score_sum},
+              {'best_score': (best_score, best),
+               'last_activity': (latest, last_activity)})
+
+
+def remove_user(user_id):
+    """Subtract a user's attempts from the rollups before the user is deleted"""
+    completed = case((QuizAttempt.completed == True, 1), else_=0)
+    completed_score = case((QuizAttempt.completed == True, db.func.coalesce(QuizAttempt.score, 0.0)), else_=0.0)
+    totals = db.session.query(
+        QuizAttempt.quiz_id,
+        Quiz.subject_id,
+        db.func.count(QuizAttempt.id),
+        db.func.sum(completed),
+        db.func.sum(completed_score)
+    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id
+    ).filter(QuizAttempt.user_id == user_id
+    ).group_by(QuizAttempt.quiz_id, Quiz.subject_id).all()
+
+    for quiz_id, subject_id, attempts, completed_count, score_sum in totals:
+        _bump_quiz(quiz_id, subject_id, {
+            'attempt_count': -attempts,
+            'completed_count': -(completed_count or 0),
+            'score_sum': -(score_sum or 0.0)
+        })
+    UserSubjectStats.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+def discard_quizzes(quizzes):
+    """Take deleted quizzes off their subject and per-user rollups"""
+    quizzes = list(quizzes)
+    if not quizzes:
+        return
+    quiz_ids = [quiz.id for quiz in quizzes]
+    for stats in QuizStats.query.filter(QuizStats.quiz_id.in_(quiz_ids)):
+        _bump(SubjectStats, {'subject_id': stats.subject_id}, {
+            'attempt_count': -stats.attempt_count,
+            'completed_count': -stats.completed_count,
+            'score_sum': -stats.score_sum
+        })
+        db.session.delete(stats)
+
+    # Best scores can't be subtracted, so recompute the affected subjects' user rollups
+    for subject_id in {quiz.subject_id for quiz in quizzes}:
+        UserSubjectStats.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+        _insert_user_subject_stats(Quiz.subject_id == subject_id, ~Quiz.id.in_(quiz_ids))
+
+
+def discard_subject(subject_id):
+    QuizStats.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+    SubjectStats.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+    UserSubjectStats.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+
+
+def _insert_user_subject_stats(*criteria):
+    completed = case((QuizAttempt.completed == True, 1), else_=0)
+    completed_score = case((QuizAttempt.completed == True, db.func.coalesce(QuizAttempt.score, 0.0)), else_=0.0)
+    best_score = case((QuizAttempt.completed == True, QuizAttempt.score), else_=None)
+    totals = db.session.query(
+        QuizAttempt.user_id,
+        Quiz.subject_id,
+        db.func.count(QuizAttempt.id),
+        db.func.sum(completed),
+        db.func.sum(completed_score),
+        db.func.max(best_score),
+        db.func.max(db.func.coalesce(QuizAttempt.completed_at, QuizAttempt.started_at))
+    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id
+    ).filter(*criteria
+    ).group_by(QuizAttempt.user_id, Quiz.subject_id)
+    db.session.execute(db.insert(UserSubjectStats).from_select(
+        ['user_id', 'subject_id', 'attempt_count', 'completed_count', 'score_sum', 'best_score', 'last_activity'],
+        totals
+    ))
+
+
+def rebuild():
+    """Recompute every rollup from the attempts table"""
+    QuizStats.query.delete(synchronize_session=False)
+    SubjectStats.query.delete(synchronize_session=False)
+    UserSubjectStats.query.delete(synchronize_session=False)
+
+    completed = case((QuizAttempt.completed == True, 1), else_=0)
+    completed_score = case((QuizAttempt.completed == True, db.func.coalesce(QuizAttempt.score, 0.0)), else_=0.0)
+
+    quiz_totals = db.session.query(
+        Quiz.id,
+        Quiz.subject_id,
+        db.func.count(QuizAttempt.id),
+        db.func.coalesce(db.func.sum(completed), 0),
+        db.func.coalesce(db.func.sum(completed_score), 0.0)
+    ).outerjoin(QuizAttempt, QuizAttempt.quiz_id == Quiz.id
+    ).group_by(Quiz.id, Quiz.subject_id)
+    db.session.execute(db.insert(QuizStats).from_select(
+        ['quiz_id', 'subject_id', 'attempt_count', 'completed_count', 'score_sum'], quiz_totals
+    ))
+
+    subject_totals = db.session.query(
+        Subject.id,
+        db.func.coalesce(db.func.sum(QuizStats.attempt_count), 0),
+        db.func.coalesce(db.func.sum(QuizStats.completed_count), 0),
+        db.func.coalesce(db.func.sum(QuizStats.score_sum), 0.0)
+    ).outerjoin(QuizStats, QuizStats.subject_id == Subject.id
+    ).group_by(Subject.id)
+    db.session.execute(db.insert(SubjectStats).from_select(
+        ['subject_id', 'attempt_count', 'completed_count', 'score_sum'], subject_totals
+    ))
+
+    _insert_user_subject_stats()
+
+
+ATTEMPTS_PER_PAGE = 20
+
+
+def user_subject_stats(user_id, completed_only=False):
+    """A user's per-subject rollups, read straight from UserSubjectStats"""
+    average_score = db.func.coalesce(
+        UserSubjectStats.score_sum / db.func.nullif(UserSubjectStats.completed_count, 0), 0.0
+    )
+    query = db.session.query(
+        Subject.name,
+        UserSubjectStats.attempt_count,
+        UserSubjectStats.completed_count,
+        average_score.label('average_score'),
+        UserSubjectStats.best_score,
+        UserSubjectStats.last_activity
+    ).join(UserSubjectStats, UserSubjectStats.subject_id == Subject.id
+    ).filter(UserSubjectStats.user_id == user_id)
+    if completed_only:
+        query = query.filter(UserSubjectStats.completed_count > 0)
+    return query.order_by(Subject.name).all()
+
+
+def user_attempts_page(user_id, page, completed_only=False, per_page=ATTEMPTS_PER_PAGE):
+    """One page of a user's attempts, newest first; returns (rows, has_next)"""
+    query = db.session.query(
+        Quiz.name,
+        Subject.name.label('subject_name'),
+        QuizAttempt.score,
+        QuizAttempt.completed,
+        QuizAttempt.completed_at
+    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id
+    ).join(Subject, Quiz.subject_id == Subject.id
+    ).filter(QuizAttempt.user_id == user_id)
+    if completed_only:
+        query = query.filter(QuizAttempt.completed == True, QuizAttempt.completed_at.isnot(None))
+    rows = query.order_by(QuizAttempt.completed_at.desc(), QuizAttempt.id.desc()
+    ).offset((page - 1) * per_page).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from app.models import db, Quiz, QuizAttempt
+from app.snapshots import total_marks
+from app.utils import calculate_score
+from app import stats
+
+SWEEP_BATCH_SIZE = 500
+# Past the time limit before an attempt is swept; covers the full-paper auto-submit grace
+SWEEP_GRACE_SECONDS = 60
+
+
+def _expired_ids(now, limit):
+    """Ids of up to limit open attempts whose time ran out, oldest first.
+
+    One range scan of ix_quiz_attempt_completed_started_at per distinct
+    quiz time limit, since the cutoff depends on the limit.
+    """
+    ids = []
+    time_limits = db.session.query(Quiz.time_limit).filter(Quiz.time_limit.isnot(None)).distinct()
+    for (time_limit,) in time_limits.all():
+        cutoff = now - timedelta(minutes=time_limit, seconds=SWEEP_GRACE_SECONDS)
+        ids += db.session.scalars(
+            db.select(QuizAttempt.id).join(Quiz, QuizAttempt.quiz_id == Quiz.id).where(
+                QuizAttempt.completed == False,
+                QuizAttempt.started_at < cutoff,
+                Quiz.time_limit == time_limit
+            ).order_by(QuizAttempt.started_at).limit(limit - len(ids))
+        ).all()
+        if len(ids) >= limit:
+            break
+    return ids
+
+
+def _close(ids):
+    # Claiming with completed == False skips attempts the student's own request closed meanwhile
+    claimed = db.session.execute(
+        db.update(QuizAttempt).where(QuizAttempt.id.in_(ids), QuizAttempt.completed == False)
+        .values(completed=True).returning(QuizAttempt.id),
+        execution_options={'synchronize_session': False}
+    ).scalars().all()
+    if not claimed:
+        return 0
+    rows = db.session.query(
+        QuizAttempt.id, QuizAttempt.user_id, QuizAttempt.quiz_id, Quiz.subject_id, QuizAttempt.started_at,
+        Quiz.time_limit, QuizAttempt.marks_earned
+    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id).filter(QuizAttempt.id.in_(claimed)).all()
+    quiz_marks = total_marks({row.quiz_id for row in rows})
+
+    closed = []
+    for row in rows:
+        # Scored out of the quiz's total marks, timed at the moment the attempt expired
+        closed.append({
+            'id': row.id,
+            'user_id': row.user_id,
+            'quiz_id': row.quiz_id,
+            'subject_id': row.subject_id,
+            'score': calculate_score(row, quiz_marks.get(row.quiz_id)),
+            'completed_at': row.started_at + timedelta(minutes=row.time_limit),
+        })
+    db.session.execute(db.update(QuizAttempt), [
+        {'id': attempt['id'], 'score': attempt['score'], 'completed_at': attempt['completed_at']}
+        for attempt in closed
+    ])
+    stats.record_attempts_completed(closed)
+    return len(closed)
+
+
+def sweep_expired_attempts(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Score and close every open attempt whose time limit has run out.
+
+    Works in batches of batch_size, each closed with one claiming UPDATE,
+    one bulk UPDATE of the scores and one rollup update per quiz and
+    student, and committed on its own. Returns the number closed.
+    """
+    now = now or datetime.utcnow()
+    closed = 0
+    while True:
+        ids = _expired_ids(now, batch_size)
+        if not ids:
+            return closed
+        closed += _close(ids)
+        db.session.commit()
+        if len(ids) < batch_size:
+            return closed
@@ -0,0 +1,162 @@
+import random
+from datetime import datetime, timedelta
+from app.models import db, Teacher, Subject, Chapter, Quiz, Question, User, QuizAttempt, UserAnswer
+from app.passwords import hash_password
+from app import stats, search, fragments, counters
+
+TOPICS = ('Algebra', 'Geometry', 'Physics', 'Chemistry', 'Biology', 'History', 'Geography',
+          'Literature', 'Economics', 'Computer Science', 'Statistics', 'Philosophy')
+INTERESTS = ('math', 'science', 'reading', 'music', 'sports', 'coding', 'art', 'history')
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+class _Writer:
+    """Buffers rows per table and writes them with executemany INSERTs.
+
+    Tables are flushed in the order they were first written to, so parents
+    always reach the database before the children that reference them.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.written = {}
+
+    def add(self, model, row):
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for model, rows in self.buffers.items():
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+                self.written[model.__tablename__] = self.written.get(model.__tablename__, 0) + len(rows)
+                rows.clear()
+        db.session.commit()
+
+
+def generate(teachers=10, subjects=20, chapters=5, quizzes=4, questions=10, users=1000,
+             attempts=5, password='password', seed=0, batch_size=20000):
+    """Add a synthetic dataset with bulk INSERTs; yields a progress line per stage.
+
+    chapters is per subject, quizzes per chapter, questions per quiz and
+    attempts per user. Every attempt is completed and answers each of its
+    quiz's questions. Ids are assigned here rather than read back, and the
+    counter caches are filled in as rows are made; the stats rollups and
+    search index are rebuilt at the end. Generated students are named
+    student<id> and share one password.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    writer = _Writer(batch_size)
+
+    first_teacher_id = _next_id(Teacher)
+    teacher_ids = list(range(first_teacher_id, first_teacher_id + teachers))
+    subjects_per_teacher = {}
+    subject_id = _next_id(Subject)
+    chapter_id = _next_id(Chapter)
+    quiz_id = _next_id(Quiz)
+    question_id = _next_id(Question)
+    subject_rows, chapter_rows, quiz_rows = [], [], []
+    quiz_questions = []  # (quiz id, [(question id, marks, correct option)])
+    for s in range(subjects):
+        owner = teacher_ids[s % teachers] if teachers else None
+        subjects_per_teacher[owner] = subjects_per_teacher.get(owner, 0) + 1
+        topic = TOPICS[s % len(TOPICS)]
+        subject_rows.append(dict(id=subject_id, name=f'{topic} {s + 1}', description=f'Synthetic {topic} course',
+                                 teacher_id=owner, created_at=now, updated_at=now,
+                                 quiz_count=chapters * quizzes))
+        sequence = 1
+        for c in range(chapters):
+            chapter_rows.append(dict(id=chapter_id, name=f'Chapter {c + 1}', description=f'{topic} chapter {c + 1}',
+                                     subject_id=subject_id, created_at=now, updated_at=now, quiz_count=quizzes))
+            for q in range(quizzes):
+                quiz_rows.append(dict(id=quiz_id, name=f'{topic} quiz {sequence}', description='Synthetic quiz',
+                                      time_limit=30, subject_id=subject_id, chapter_id=chapter_id,
+                                      sequence_number=sequence, max_attempts=3, passing_score=70.0,
+                                      deadline=None, prerequisite_quiz_id=None, full_paper=False,
+                                      question_version=0, question_count=questions,
+                                      created_at=now, updated_at=now))
+                quiz_questions.append((quiz_id, [
+                    (question_id + k, rng.randint(1, 3), rng.randint(1, 4)) for k in range(questions)
+                ]))
+                question_id += questions
+                quiz_id += 1
+                sequence += 1
+            chapter_id += 1
+        subject_id += 1
+
+    for n, id_ in enumerate(teacher_ids):
+        writer.add(Teacher, dict(id=id_, name=f'Teacher {n + 1}', qualifications='M.Sc.', degree='Ph.D.',
+                                 email=f'teacher{id_}@example.test', bio=None, created_at=now,
+                                 subject_count=subjects_per_teacher.get(id_, 0)))
+    for row in subject_rows:
+        writer.add(Subject, row)
+    for row in chapter_rows:
+        writer.add(Chapter, row)
+    for row in quiz_rows:
+        writer.add(Quiz, row)
+    writer.flush()
+    yield f'{teachers} teachers, {subjects} subjects, {len(chapter_rows)} chapters, {len(quiz_rows)} quizzes'
+
+    for quiz, quiz_question_list in quiz_questions:
+        for id_, marks, correct in quiz_question_list:
+            writer.add(Question, dict(id=id_, text=f'Synthetic question {id_}?', marks=marks,
+                                      option1='Option A', option2='Option B', option3='Option C',
+                                      option4='Option D', correct_option=correct, quiz_id=quiz,
+                                      created_at=now))
+    writer.flush()
+    yield f'{len(quiz_questions) * questions} questions'
+
+    password_hash = hash_password(password)
+    attempts = min(attempts, len(quiz_questions))
+    user_id = _next_id(User)
+    attempt_id = _next_id(QuizAttempt)
+    answer_id = _next_id(UserAnswer)
+    for n in range(users):
+        days = rng.randint(1, 365)
+        joined = now - timedelta(days=days)
+        writer.add(User, dict(id=user_id, username=f'student{user_id}', password_hash=password_hash,
+                              is_admin=False, age=rng.randint(15, 40),
+                              interests=', '.join(rng.sample(INTERESTS, 2)), created_at=joined,
+                              attempt_count=attempts))
+        for quiz, quiz_question_list in rng.sample(quiz_questions, attempts):
+            started = now - timedelta(minutes=rng.randint(60, days * 1440))
+            answered = started
+            correct_count = marks_earned = marks_possible = 0
+            answers = []
+            for id_, marks, correct in quiz_question_list:
+                selected = correct if rng.random() < 0.7 else rng.randint(1, 4)
+                is_correct = selected == correct
+                answered += timedelta(seconds=rng.randint(5, 90))
+                answers.append(dict(id=answer_id, attempt_id=attempt_id, question_id=id_,
+                                    selected_option=selected, is_correct=is_correct, answered_at=answered))
+                answer_id += 1
+                correct_count += is_correct
+                marks_earned += marks if is_correct else 0
+                marks_possible += marks
+            writer.add(QuizAttempt, dict(id=attempt_id, user_id=user_id, quiz_id=quiz,
+                                         score=marks_earned / marks_possible * 100 if marks_possible else 0.0,
+                                         completed=True, started_at=started, completed_at=answered,
+                                         answered_count=len(answers), correct_count=correct_count,
+                                         marks_earned=marks_earned, marks_possible=marks_possible))
+            for row in answers:
+                writer.add(UserAnswer, row)
+            attempt_id += 1
+        user_id += 1
+    writer.flush()
+    counters.bump_total('students', users)
+    yield (f'{users} users, {writer.written.get("quiz_attempt", 0)} attempts, '
+           f'{writer.written.get("user_answer", 0)} answers')
+
+    stats.rebuild()
+    search.rebuild()
+    # The bulk INSERTs bypass the session, so invalidate the cached catalog pages here
+    fragments.bump()
+    db.session.commit()
+    yield 'rebuilt statistics rollups and search index'
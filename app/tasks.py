@@ -0,0 +1,41 @@
+"""Work done by app.jobs: off the request in async mode, inline otherwise.
+
+None of these commit, so each runs in the same transaction as its job's
+"done" mark, and a task that finds its object already gone does nothing.
+"""
+from app.models import db, Subject, Teacher, User, Quiz, QuizAttempt, UserAnswer
+from app.jobs import task
+from app import stats, search, counters
+
+
+@task('record_attempt_completed')
+def record_attempt_completed(attempt_id):
+    attempt = db.session.get(QuizAttempt, attempt_id)
+    if attempt is not None and attempt.completed:
+        stats.record_attempt_completed(attempt)
+
+
+@task('delete_subject')
+def delete_subject(subject_id):
+    subject = db.session.get(Subject, subject_id)
+    if subject is None:
+        return
+    stats.discard_subject(subject.id)
+    search.remove_subject(subject.id)
+    counters.bump(Teacher, subject.teacher_id, 'subject_count', -1)
+    counters.discount_attempts(QuizAttempt.quiz_id.in_(db.select(Quiz.id).where(Quiz.subject_id == subject.id)))
+    db.session.delete(subject)
+
+
+@task('delete_user')
+def delete_user(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    stats.remove_user(user.id)
+    attempt_ids = db.select(QuizAttempt.id).where(QuizAttempt.user_id == user.id)
+    UserAnswer.query.filter(UserAnswer.attempt_id.in_(attempt_ids)).delete(synchronize_session=False)
+    QuizAttempt.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    db.session.delete(user)
+    db.session.flush()
+    counters.bump_total('students', -1)
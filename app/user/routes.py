@@ -1,14 +1,20 @@
 from flask import render_template, url_for, flash, redirect, request, abort
 from flask_login import current_user, login_required
 from app import db
-from app.models import Subject, Quiz, QuizAttempt, Question, UserAnswer, Chapter
+from app.models import User, Subject, Quiz, QuizAttempt, Question, UserAnswer, Chapter, resolve_quiz_access
 from app.user.forms import ProfileForm, QuizAnswerForm
-from app.utils import calculate_score
+from app.snapshots import get_quiz_snapshot
+from app import search, counters
+from app.stats import record_attempt_started, user_subject_stats, user_attempts_page
+from app.replica import read_replica
+from app.principal import invalidate_principal
 from datetime import datetime, timedelta
 from . import user
 # Add this import at the top of the file
 from sqlalchemy import func
 
+FULL_PAPER_GRACE_SECONDS = 30
+
 @user.before_request
 @login_required
 def require_user():
@@ -24,46 +30,47 @@ def dashboard():
     elif request.method == 'GET':
         search_query = request.args.get('q', '')
     
+    page = max(request.args.get('page', 1, type=int), 1)
+    hits, has_next = [], False
     if search_query:
-        subjects = Subject.query.filter(Subject.name.ilike(f'%{search_query}%')).all()
+        # Ranked full-text hits; the subjects they belong to are shown in rank order
+        hits, has_next = search.search(search_query, kinds=search.STUDENT_KINDS, page=page)
+        subject_ids = list(dict.fromkeys(hit.subject_id for hit in hits))
+        subjects_by_id = {subject.id: subject for subject in Subject.query.filter(Subject.id.in_(subject_ids))}
+        subjects = [subjects_by_id[subject_id] for subject_id in subject_ids if subject_id in subjects_by_id]
     else:
-        subjects = Subject.query.all()
-    return render_template('user/dashboard.html', subjects=subjects, search_query=search_query)
+        # Left unexecuted: the template only runs it when the cached subject cards are stale
+        subjects = Subject.query.options(db.selectinload(Subject.quizzes))
+    return render_template('user/dashboard.html', subjects=subjects, search_query=search_query,
+                         hits=hits, page=page, has_next=has_next)
 
 @user.route('/profile', methods=['GET', 'POST'])
 def profile():
+    # current_user is a cached principal; edit the full row
+    account = db.session.get(User, current_user.id)
     form = ProfileForm()
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.age = form.age.data
-        current_user.interests = form.interests.data
+        account.username = form.username.data
+        account.age = form.age.data
+        account.interests = form.interests.data
         db.session.commit()
+        invalidate_principal(account.id)
         flash('Your profile has been updated!', 'success')
         return redirect(url_for('user.profile'))
     elif request.method == 'GET':
-        form.username.data = current_user.username
-        form.age.data = current_user.age
-        form.interests.data = current_user.interests
+        form.username.data = account.username
+        form.age.data = account.age
+        form.interests.data = account.interests
     return render_template('user/profile.html', form=form)
 
 @user.route('/subject/<int:subject_id>/quizzes')
 def view_quizzes(subject_id):
     subject = Subject.query.get_or_404(subject_id)
 
-    # Prepare quiz access information for each quiz
-    quiz_access_info = []
-    for quiz in sorted(subject.quizzes, key=lambda q: q.sequence_number):
-        is_unlocked = quiz.is_unlocked_for_user(current_user)
-        attempts_remaining = quiz.attempts_remaining_for_user(current_user)
-        is_past_deadline = quiz.is_past_deadline()
-
-        quiz_access_info.append({
-            'quiz': quiz,
-            'is_unlocked': is_unlocked,
-            'attempts_remaining': attempts_remaining,
-            'is_past_deadline': is_past_deadline,
-            'can_attempt': is_unlocked and attempts_remaining > 0 and not is_past_deadline
-        })
+    # Prepare quiz access information for all quizzes in one batch
+    quizzes = sorted(subject.quizzes, key=lambda q: q.sequence_number)
+    access = resolve_quiz_access(quizzes, current_user)
+    quiz_access_info = [access[quiz.id] for quiz in quizzes]
 
     return render_template('user/view_quizzes.html', subject=subject, quiz_access_info=quiz_access_info)
 @user.route('/quiz/<int:quiz_id>/attempt', methods=['GET', 'POST'])
@@ -93,11 +100,13 @@ def attempt_quiz(quiz_id):
     
     if existing_attempt:
         attempt = existing_attempt
-        # Check if time has expired
+        # Check if time has expired (a full paper auto-submitted at 0:00 gets a short grace)
         time_elapsed = datetime.utcnow() - attempt.started_at
-        if time_elapsed.total_seconds() > quiz.time_limit * 60:
-            attempt.completed = True
-            attempt.completed_at = datetime.utcnow()
+        grace = FULL_PAPER_GRACE_SECONDS if quiz.full_paper and request.method == 'POST' else 0
+        if time_elapsed.total_seconds() > quiz.time_limit * 60 + grace:
+            # Scored out of the whole quiz, so the unanswered questions count as wrong;
+            # closed at the moment time ran out, as the sweeper does
+            attempt.finalize(attempt.started_at + timedelta(minutes=quiz.time_limit))
             db.session.commit()
             flash('Time for this attempt has expired!', 'danger')
             return redirect(url_for('user.quiz_result', attempt_id=attempt.id))
@@ -109,20 +118,21 @@ def attempt_quiz(quiz_id):
             started_at=datetime.utcnow()
         )
         db.session.add(attempt)
+        record_attempt_started(attempt, quiz)
+        counters.bump(User, current_user.id, 'attempt_count')
         db.session.commit()
+
+    if quiz.full_paper:
+        return attempt_full_paper(quiz, attempt)
     
-    # Get unanswered questions
-    answered_question_ids = [answer.question_id for answer in attempt.answers]
-    current_question = Question.query.filter(
-        Question.quiz_id == quiz.id,
-        ~Question.id.in_(answered_question_ids)
-    ).first()
+    # Get the next unanswered question from the cached snapshot
+    snapshot = get_quiz_snapshot(quiz)
+    answered_question_ids = {answer.question_id for answer in attempt.answers}
+    current_question = snapshot.next_unanswered(answered_question_ids)
     
     if not current_question:
         # All questions answered, complete the attempt
-        attempt.completed = True
-        attempt.completed_at = datetime.utcnow()
-        attempt.score = calculate_score(attempt)
+        attempt.finalize()
         db.session.commit()
         return redirect(url_for('user.quiz_result', attempt_id=attempt.id))
     
@@ -134,15 +144,14 @@ def attempt_quiz(quiz_id):
     form = QuizAnswerForm()
     if form.validate_on_submit():
         selected_option = int(request.form.get('option'))
-        is_correct = (selected_option == current_question.correct_option)
-        
-        answer = UserAnswer(
-            attempt_id=attempt.id,
-            question_id=current_question.id,
-            selected_option=selected_option,
-            is_correct=is_correct
-        )
-        db.session.add(answer)
+        attempt.record_answer(current_question, selected_option)
+
+        # Finish straight away after the last question instead of another round trip
+        answered_question_ids.add(current_question.id)
+        if snapshot.next_unanswered(answered_question_ids) is None:
+            attempt.finalize()
+            db.session.commit()
+            return redirect(url_for('user.quiz_result', attempt_id=attempt.id))
         db.session.commit()
         
         return redirect(url_for('user.attempt_quiz', quiz_id=quiz.id))
@@ -154,11 +163,57 @@ def attempt_quiz(quiz_id):
                          remaining_time=remaining_time,
                          attempt=attempt)  # Add this line to pass the attempt variable
     
+def attempt_full_paper(quiz, attempt):
+    """Serve every question at once and grade the whole paper in one transaction"""
+    questions = get_quiz_snapshot(quiz).questions
+
+    time_elapsed = datetime.utcnow() - attempt.started_at
+    remaining_time = max(0, quiz.time_limit * 60 - time_elapsed.total_seconds())
+
+    form = QuizAnswerForm()
+    if form.validate_on_submit():
+        answered_question_ids = {answer.question_id for answer in attempt.answers}
+        answered_at = datetime.utcnow()
+        rows = []
+        correct = marks_earned = marks_possible = 0
+        for question in questions:
+            if question.id in answered_question_ids:
+                continue
+            selected_option = request.form.get(f'question_{question.id}', type=int)
+            if selected_option not in (1, 2, 3, 4):
+                selected_option = None
+            is_correct = selected_option == question.correct_option
+            marks = question.marks or 0
+            correct += is_correct
+            marks_earned += marks if is_correct else 0
+            marks_possible += marks
+            rows.append({
+                'attempt_id': attempt.id,
+                'question_id': question.id,
+                'selected_option': selected_option,
+                'is_correct': is_correct,
+                'answered_at': answered_at
+            })
+        if rows:
+            db.session.execute(db.insert(UserAnswer), rows)
+            attempt.add_to_counters(len(rows), correct, marks_earned, marks_possible)
+
+        attempt.finalize(completed_at=answered_at)
+        db.session.commit()
+        return redirect(url_for('user.quiz_result', attempt_id=attempt.id))
+
+    return render_template('user/attempt_quiz_full.html',
+                         quiz=quiz,
+                         questions=questions,
+                         form=form,
+                         remaining_time=remaining_time,
+                         attempt=attempt)
+
 @user.route('/attempt/<int:attempt_id>/result')
 def quiz_result(attempt_id):
-    # Correct way to eager load answers and their related questions
+    # Questions come from the quiz snapshot, so only the answers are loaded
     attempt = QuizAttempt.query.options(
-        db.joinedload(QuizAttempt.answers).joinedload(UserAnswer.question)
+        db.joinedload(QuizAttempt.answers)
     ).get_or_404(attempt_id)
     
     if attempt.user_id != current_user.id:
@@ -166,42 +221,23 @@ def quiz_result(attempt_id):
     
     # Ensure score is calculated
     if attempt.score is None:
-        attempt.score = calculate_score(attempt)
-        attempt.completed = True
-        attempt.completed_at = datetime.utcnow()
+        attempt.finalize()
         db.session.commit()
     
-    return render_template('user/quiz_result.html', attempt=attempt)
+    questions = get_quiz_snapshot(attempt.quiz).by_id
+    return render_template('user/quiz_result.html', attempt=attempt, questions=questions)
 
 
-# Then update the performance route
 @user.route('/performance')
+@read_replica
 def performance():
-    # User's performance by subject (only completed attempts)
-    subject_stats = db.session.query(
-        Subject.name,
-        func.avg(QuizAttempt.score).label('average_score')
-    ).join(Quiz, Quiz.subject_id == Subject.id
-    ).join(QuizAttempt, QuizAttempt.quiz_id == Quiz.id
-    ).filter(
-        QuizAttempt.user_id == current_user.id,
-        QuizAttempt.completed == True,
-        QuizAttempt.completed_at.isnot(None)
-    ).group_by(Subject.name).all()
-    
-    # User's completed quiz attempts
-    quiz_attempts = db.session.query(
-        Quiz.name,
-        Subject.name.label('subject_name'),
-        QuizAttempt.score,
-        QuizAttempt.completed_at
-    ).join(Quiz, QuizAttempt.quiz_id == Quiz.id
-    ).join(Subject, Quiz.subject_id == Subject.id
-    ).filter(
-        QuizAttempt.user_id == current_user.id,
-        QuizAttempt.completed == True,
-        QuizAttempt.completed_at.isnot(None)
-    ).order_by(QuizAttempt.completed_at.desc()).all()
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    # User's performance by subject, read from the per-user rollups
+    subject_stats = user_subject_stats(current_user.id, completed_only=True)
+    
+    # One page of the user's completed quiz attempts
+    quiz_attempts, has_next = user_attempts_page(current_user.id, page, completed_only=True)
     
     # Prepare data for charts
     subject_names = [stat.name for stat in subject_stats]
@@ -210,21 +246,19 @@ def performance():
     return render_template('user/performance.html',
                          subject_stats=subject_stats,
                          quiz_attempts=quiz_attempts,
+                         page=page,
+                         has_next=has_next,
                          subject_names=subject_names,
                          subject_scores=subject_scores)
     
     
 @user.route('/subject/<int:subject_id>')
 def view_subject(subject_id):
-    subject = Subject.query.options(
-        db.joinedload(Subject.chapters).joinedload(Chapter.quizzes),
-        db.joinedload(Subject.quizzes)
-    ).get_or_404(subject_id)
+    # The chapters, teacher and quizzes are only loaded if the page's cached fragment is stale
+    subject = Subject.query.get_or_404(subject_id)
     return render_template('user/view_subject.html', subject=subject)
 
 @user.route('/chapter/<int:chapter_id>')
 def view_chapter(chapter_id):
-    chapter = Chapter.query.options(
-        db.joinedload(Chapter.quizzes)
-    ).get_or_404(chapter_id)
+    chapter = Chapter.query.get_or_404(chapter_id)
     return render_template('user/view_chapter.html', chapter=chapter)
\ No newline at end of file
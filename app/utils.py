@@ -9,10 +9,12 @@ def forbidden(e):
 def server_error(e):
     return render_template('errors/500.html'), 500
 
-def calculate_score(attempt):
-    if not attempt.answers:
+def hashing_busy(e):
+    # Sheds load when the password hashing pool is saturated (app.passwords)
+    return render_template('errors/503.html'), 503, {'Retry-After': '5'}
+
+def calculate_score(attempt, total_marks):
+    # Marks-weighted percentage of the quiz's total marks; unanswered questions earn nothing
+    if not total_marks:
         return 0.0
-    
-    total_questions = len(attempt.answers)
-    correct_answers = sum(1 for answer in attempt.answers if answer.is_correct)
-    return (correct_answers / total_questions) * 100
\ No newline at end of file
+    return ((attempt.marks_earned or 0) / total_marks) * 100
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""HTTP load test of the student and admin routes of a running server.
+
+Each simulated student logs in, opens the dashboard, a subject's quiz list,
+takes a quiz to the end (one POST per question) and opens the result and
+performance pages, then logs out and starts over until the time is up.
+Admin clients reload the statistics pages meanwhile. Latency percentiles
+and throughput are reported per route, with ids folded into <id>.
+
+Students are the student<id> accounts made by `flask generate-data`:
+
+    flask generate-data --users 20000 --attempts 10
+    python run.py  # or any production server
+    python benchmarks/load_test.py --user-ids 2-20001 --students 50 --admins 2 --seconds 60
+"""
+import argparse
+import http.client
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+SUBJECT_LINK = re.compile(r'href="/subject/(\d+)"')
+QUIZ_LINK = re.compile(r'href="/quiz/(\d+)/attempt"')
+ROUTE_IDS = re.compile(r'/\d+')
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, route, seconds, ok):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(route, []).append(seconds)
+            else:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class Client:
+    """One browser: a keep-alive connection and a cookie jar; redirects are not followed"""
+
+    def __init__(self, base_url, results):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=60)
+        self.results = results
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        route = f'{method} {ROUTE_IDS.sub("/<id>", path.split("?")[0])}'
+        started = time.perf_counter()
+        try:
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the kept-alive connection (idle timeout, worker
+                # restart); like a browser, retry once on a new one
+                self.connection.close()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+            text = response.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.results.add(route, time.perf_counter() - started, False)
+            return None, '', None
+        elapsed = time.perf_counter() - started
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        self.results.add(route, elapsed, response.status < 400)
+        return response.status, text, response.headers.get('Location')
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, text, data):
+        match = CSRF.search(text)
+        form = dict(data, csrf_token=match.group(1)) if match else data
+        return self.request('POST', path, form)
+
+
+def _path(location):
+    return urlsplit(location).path if location else None
+
+
+def take_quiz(client, rng, quiz_id):
+    path = f'/quiz/{quiz_id}/attempt'
+    status, text, location = client.get(path)
+    while status == 200 and 'name="option"' in text:
+        status, text, location = client.post(path, text, {'option': rng.randint(1, 4), 'submit': 'Next'})
+        if status != 302 or _path(location) != path:
+            break
+        status, text, location = client.get(path)
+    if status == 302 and '/result' in (_path(location) or ''):
+        client.get(_path(location))
+
+
+def student(base_url, usernames, password, deadline, results, seed):
+    rng = random.Random(seed)
+    client = Client(base_url, results)
+    while time.perf_counter() < deadline:
+        client.cookies.clear()
+        _, text, _ = client.get('/login')
+        status, _, _ = client.post('/login', text, {'username': rng.choice(usernames), 'password': password})
+        if status != 302:
+            continue
+        _, text, _ = client.get('/dashboard')
+        subjects = SUBJECT_LINK.findall(text)
+        if subjects:
+            _, text, _ = client.get(f'/subject/{rng.choice(subjects)}/quizzes')
+            quizzes = QUIZ_LINK.findall(text)
+            if quizzes:
+                take_quiz(client, rng, rng.choice(quizzes))
+        client.get('/performance')
+        client.get('/logout')
+
+
+def admin(base_url, username, password, deadline, results):
+    client = Client(base_url, results)
+    _, text, _ = client.get('/quizmaster/login')
+    client.post('/quizmaster/login', text, {'username': username, 'password': password})
+    while time.perf_counter() < deadline:
+        client.get('/admin/statistics')
+        client.get('/admin/user-statistics?sort=average')
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def report(results, elapsed):
+    print(f'{"route":<36} {"requests":>8} {"req/s":>7} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7} {"errors":>6}')
+    routes = sorted(set(results.latencies) | set(results.errors))
+    for route in routes:
+        latencies = sorted(results.latencies.get(route, ()))
+        errors = results.errors.get(route, 0)
+        if latencies:
+            p50, p95, p99 = (statistics.median(latencies) * 1000, percentile(latencies, 0.95) * 1000,
+                             percentile(latencies, 0.99) * 1000)
+        else:
+            p50 = p95 = p99 = 0
+        print(f'{route:<36} {len(latencies):>8} {len(latencies) / elapsed:>7.1f} '
+              f'{p50:>7.0f} {p95:>7.0f} {p99:>7.0f} {errors:>6}')
+    total = sum(len(latencies) for latencies in results.latencies.values())
+    print(f'{"total":<36} {total:>8} {total / elapsed:>7.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--user-ids', required=True, help='range of generated student ids, e.g. 2-20001')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--students', type=int, default=20, help='concurrent simulated students')
+    parser.add_argument('--admins', type=int, default=1, help='concurrent admins reloading statistics')
+    parser.add_argument('--admin-username', default='quizmaster')
+    parser.add_argument('--admin-password', default='123')
+    parser.add_argument('--seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    try:
+        first, last = (int(value) for value in args.user_ids.split('-'))
+    except ValueError:
+        parser.error('--user-ids must look like 2-20001')
+    usernames = [f'student{user_id}' for user_id in range(first, last + 1)]
+
+    results = Results()
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=student, args=(args.base_url, usernames, args.password, deadline, results, n))
+               for n in range(args.students)]
+    threads += [threading.Thread(target=admin, args=(args.base_url, args.admin_username, args.admin_password,
+                                                     deadline, results))
+                for _ in range(args.admins)]
+    print(f'{args.students} students, {args.admins} admins, {args.seconds:g}s against {args.base_url}',
+          file=sys.stderr)
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(results, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
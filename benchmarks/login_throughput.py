@@ -0,0 +1,107 @@
+"""Login throughput for a range of password-hashing pool sizes.
+
+Client threads post to /login as fast as they can, each as its own user,
+the way students sign in at the start of an exam. For each pool size the
+app gets PASSWORD_HASH_WORKERS workers; logins refused by admission control
+(503) are counted separately from the successful ones.
+
+    python benchmarks/login_throughput.py --workers 1,2,4,8 --clients 32 --seconds 5
+    python benchmarks/login_throughput.py --pool process --method pbkdf2:sha256:600000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SQLiteConfig  # noqa: E402
+from app import create_app  # noqa: E402
+from app.models import db, User  # noqa: E402
+from app.passwords import hash_password  # noqa: E402
+
+PASSWORD = 'benchmark-password'
+
+
+def client(app, username, deadline, results, lock):
+    latencies, busy = [], 0
+    with app.test_client() as test_client:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = test_client.post('/login', data={'username': username, 'password': PASSWORD})
+            if response.status_code == 503:
+                busy += 1
+            elif response.status_code == 302:
+                latencies.append(time.perf_counter() - started)
+                test_client.get('/logout')
+            else:
+                raise RuntimeError(f'login returned {response.status_code}')
+    with lock:
+        results['latencies'] += latencies
+        results['busy'] += busy
+
+
+def run(workdir, workers, args):
+    config = type('LoginBench', (SQLiteConfig,), dict(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(workdir, f'login-{workers}.db'),
+        WTF_CSRF_ENABLED=False,
+        INIT_DB_ON_STARTUP=True,
+        PASSWORD_HASH_METHOD=args.method,
+        PASSWORD_HASH_POOL=args.pool,
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_QUEUE=args.queue,
+        PASSWORD_HASH_WAIT_SECONDS=args.wait,
+    ))
+    app = create_app(config)
+    usernames = [f'bench-{i}' for i in range(args.clients)]
+    with app.app_context():
+        # Every user shares one hash; only verification is being measured
+        password_hash = hash_password(PASSWORD)
+        db.session.add_all(User(username=name, password_hash=password_hash) for name in usernames)
+        db.session.commit()
+
+    results = {'latencies': [], 'busy': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=client, args=(app, name, deadline, results, lock)) for name in usernames]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    app.extensions['qna_password_pool'].shutdown()
+
+    latencies = sorted(results['latencies'])
+    p50 = statistics.median(latencies) * 1000 if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f'{workers:>7} {len(latencies) / elapsed:>9.1f} {p50:>8.0f} {p95:>8.0f} {results["busy"]:>6}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4,8', help='comma-separated pool sizes')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--pool', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--queue', type=int, default=16)
+    parser.add_argument('--wait', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{args.clients} clients, {args.pool} pool, {args.method}, {os.cpu_count()} CPU(s), {args.seconds:g}s each')
+    print(f'{"workers":>7} {"logins/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"503s":>6}')
+    workdir = tempfile.mkdtemp(prefix='qna-bench-')
+    try:
+        for workers in (int(value) for value in args.workers.split(',')):
+            run(workdir, workers, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
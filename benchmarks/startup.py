@@ -0,0 +1,87 @@
+"""Cold start time: importing the app package and running create_app().
+
+Every sample is a fresh Python process, the way a pre-forked server or a
+restarted worker starts. Three cases are measured against SQLite: a first
+boot on an empty database (schema, search index and quizmaster account
+created), a restart with INIT_DB_ON_STARTUP on, and a restart with it off
+after `flask init-db`. --top also lists the slowest imports.
+
+    python benchmarks/startup.py --runs 10 --top 10
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+from config import config_from_env
+imported = time.perf_counter()
+create_app(config_from_env())
+created = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000}))
+"""
+
+
+def probe(database, init, extra_args=()):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database, QNA_DB_PROFILE='sqlite',
+               INIT_DB_ON_STARTUP='1' if init else '0', PYTHONPATH=ROOT, PYTHONWARNINGS='ignore')
+    result = subprocess.run([sys.executable, *extra_args, '-c', PROBE], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, top):
+    """(cumulative ms, module) for the modules -X importtime took longest on"""
+    times = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times.append((int(cumulative) / 1000, module.rstrip()))
+    return sorted(times, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='processes per case')
+    parser.add_argument('--top', type=int, default=0, help='also list the N slowest imports')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='qna-startup-')
+    try:
+        samples = {'first boot': [], 'restart, init on': [], 'restart, init off': []}
+        for n in range(args.runs):
+            database = os.path.join(workdir, f'first-{n}.db')
+            samples['first boot'].append(probe(database, init=True)[0])
+            samples['restart, init on'].append(probe(database, init=True)[0])
+            samples['restart, init off'].append(probe(database, init=False)[0])
+
+        print(f'{args.runs} process(es) per case, median (min) ms')
+        print(f'{"case":<20} {"import":>15} {"create_app":>15} {"total":>15}')
+        for case, results in samples.items():
+            columns = []
+            for values in ([r['import_ms'] for r in results], [r['create_app_ms'] for r in results],
+                           [r['import_ms'] + r['create_app_ms'] for r in results]):
+                columns.append(f'{statistics.median(values):7.0f} ({min(values):5.0f})')
+            print(f'{case:<20} {columns[0]:>15} {columns[1]:>15} {columns[2]:>15}')
+
+        if args.top:
+            _, stderr = probe(os.path.join(workdir, 'first-0.db'), init=False, extra_args=('-X', 'importtime'))
+            print('\nSlowest imports (cumulative ms):')
+            for milliseconds, module in slowest_imports(stderr, args.top):
+                print(f'{milliseconds:8.1f}  {module}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,127 @@
 import os
 
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
 class Config:
-    SECRET_KEY ='dev-secret-key-123'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///qna.db'
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-123')
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///qna.db')
+    )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     QUIZMASTER_USERNAME = 'quizmaster'
-    QUIZMASTER_PASSWORD = '123'
\ No newline at end of file
+    QUIZMASTER_PASSWORD = '123'
+    # Create missing tables, the search index and the quizmaster account in
+    # create_app; turn off in production and run `flask init-db` on deploy
+    INIT_DB_ON_STARTUP = os.environ.get('INIT_DB_ON_STARTUP', '1').lower() in ('1', 'true', 'yes')
+
+    # Password hashing (see app/passwords.py). Changing the method or salt
+    # length rehashes each password at its owner's next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = _env_int('PASSWORD_SALT_LENGTH', 16)
+    PASSWORD_HASH_POOL = os.environ.get('PASSWORD_HASH_POOL', 'thread')  # or 'process'
+    PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+    PASSWORD_HASH_QUEUE = _env_int('PASSWORD_HASH_QUEUE', 4 * (os.cpu_count() or 1))
+    PASSWORD_HASH_WAIT_SECONDS = float(os.environ.get('PASSWORD_HASH_WAIT_SECONDS', 5))
+
+    # Logged-in user (id, username, is_admin) cache per process (see app/principal.py); 0 disables it
+    USER_CACHE_TTL_SECONDS = _env_int('USER_CACHE_TTL_SECONDS', 30)
+    USER_CACHE_SIZE = _env_int('USER_CACHE_SIZE', 10000)
+
+    # Per-request SQL timing headers, the admin SQL activity page and the
+    # slow-request log (see app/instrumentation.py)
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SQL_INSTRUMENTATION_HISTORY = _env_int('SQL_INSTRUMENTATION_HISTORY', 500)
+    SQL_INSTRUMENTATION_TOP = 3  # slowest statements kept per request
+    SLOW_REQUEST_MS = _env_int('SLOW_REQUEST_MS', 500)
+    SLOW_REQUEST_QUERY_COUNT = _env_int('SLOW_REQUEST_QUERY_COUNT', 30)
+    SLOW_QUERY_MS = _env_int('SLOW_QUERY_MS', 100)
+    SLOW_REQUEST_LOG = os.environ.get('SLOW_REQUEST_LOG')  # JSON lines file; unset, they go to the qna.slow_requests logger (stderr by default)
+
+    # PRAGMAs run on every new SQLite connection (see app/database.py)
+    SQLITE_PRAGMAS = {}
+
+    # Read replica for the analytics pages and API GETs (see app/replica.py);
+    # unset, every query goes to the primary
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    REPLICA_MAX_LAG_SECONDS = _env_int('REPLICA_MAX_LAG_SECONDS', 300)
+    REPLICA_CHECK_SECONDS = _env_int('REPLICA_CHECK_SECONDS', 5)
+
+    # Background jobs (see app/jobs.py and worker.py). Off, jobs run inline
+    # in the request that queues them and no worker is needed.
+    JOB_QUEUE_ASYNC = os.environ.get('JOB_QUEUE_ASYNC', '').lower() in ('1', 'true', 'yes')
+    JOB_MAX_ATTEMPTS = _env_int('JOB_MAX_ATTEMPTS', 5)
+    JOB_RETRY_BASE_SECONDS = _env_int('JOB_RETRY_BASE_SECONDS', 5)  # doubles with each failed attempt
+    JOB_TIMEOUT_SECONDS = _env_int('JOB_TIMEOUT_SECONDS', 300)  # a running job older than this is retried
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+    JOB_RETENTION_HOURS = _env_int('JOB_RETENTION_HOURS', 24)
+
+    # Fragment cache for the student subject, chapter and dashboard pages (see
+    # app/fragments.py): 'lru' per process, 'filesystem' shared by the
+    # processes of a host, or 'none'. Catalog edits invalidate it at once;
+    # the TTL bounds how long an entry is kept.
+    FRAGMENT_CACHE = os.environ.get('FRAGMENT_CACHE', 'lru')
+    FRAGMENT_CACHE_TTL_SECONDS = _env_int('FRAGMENT_CACHE_TTL_SECONDS', 300)
+    FRAGMENT_CACHE_SIZE = _env_int('FRAGMENT_CACHE_SIZE', 1000)  # lru entries
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')  # filesystem; default instance/fragment-cache
+
+    # Production server (see gunicorn.conf.py): pre-forked worker processes,
+    # each serving SERVER_THREADS requests at a time
+    SERVER_BIND = os.environ.get('SERVER_BIND', '127.0.0.1:8000')
+    SERVER_WORKERS = _env_int('SERVER_WORKERS', 2 * (os.cpu_count() or 1) + 1)
+    SERVER_THREADS = _env_int('SERVER_THREADS', 4)
+    SERVER_BACKLOG = _env_int('SERVER_BACKLOG', 2048)  # pending connections the listening socket queues
+    SERVER_KEEPALIVE_SECONDS = _env_int('SERVER_KEEPALIVE_SECONDS', 5)  # idle time before a kept-alive connection is closed
+    SERVER_TIMEOUT_SECONDS = _env_int('SERVER_TIMEOUT_SECONDS', 30)  # a worker silent this long is killed and replaced
+    SERVER_GRACEFUL_TIMEOUT_SECONDS = _env_int('SERVER_GRACEFUL_TIMEOUT_SECONDS', 30)  # drain time on stop or reload
+    SERVER_MAX_REQUESTS = _env_int('SERVER_MAX_REQUESTS', 0)  # recycle a worker after this many requests; 0 never
+    SERVER_PIDFILE = os.environ.get('SERVER_PIDFILE')
+
+
+class SQLiteConfig(Config):
+    """SQLite tuned for concurrent requests.
+
+    WAL lets readers run alongside the single writer, busy_timeout makes
+    writers wait for the lock instead of failing with "database is locked",
+    and synchronous=NORMAL is durable in WAL mode apart from the last
+    transactions before a power loss.
+    """
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'synchronous': 'NORMAL',
+        'foreign_keys': 'ON',
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    }
+
+
+class PostgresConfig(Config):
+    """PostgreSQL with a sized connection pool; set DATABASE_URL to a postgresql:// URL"""
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+PROFILES = {
+    'default': Config,
+    'sqlite': SQLiteConfig,
+    'postgres': PostgresConfig,
+}
+
+
+def config_from_env():
+    """The config class named by QNA_DB_PROFILE, else the one matching DATABASE_URL"""
+    profile = os.environ.get('QNA_DB_PROFILE')
+    if profile:
+        if profile not in PROFILES:
+            raise ValueError(f"QNA_DB_PROFILE must be one of {', '.join(PROFILES)}")
+        return PROFILES[profile]
+    if Config.SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+        return PostgresConfig
+    return SQLiteConfig
@@ -0,0 +1,41 @@
+"""Production server settings, read from the SERVER_* entries of config.py.
+
+    gunicorn -c gunicorn.conf.py run:app
+
+The app is created once in the master (preload_app), so startup work such
+as INIT_DB_ON_STARTUP runs once and the workers fork with it already
+imported. Each worker is a process serving SERVER_THREADS requests at a
+time. Signals to the master:
+
+    HUP   re-read this file and replace the workers one generation at a time,
+          letting each old worker finish its requests (code is not reloaded
+          because it was preloaded; use USR2 then QUIT for a new release)
+    TERM  stop accepting connections, wait up to SERVER_GRACEFUL_TIMEOUT_SECONDS
+          for in-flight requests, then exit
+    TTIN/TTOU  add or remove a worker
+"""
+from config import config_from_env
+
+_config = config_from_env()
+
+bind = _config.SERVER_BIND.split(',')
+workers = _config.SERVER_WORKERS
+worker_class = 'gthread'
+threads = _config.SERVER_THREADS
+backlog = _config.SERVER_BACKLOG
+keepalive = _config.SERVER_KEEPALIVE_SECONDS
+timeout = _config.SERVER_TIMEOUT_SECONDS
+graceful_timeout = _config.SERVER_GRACEFUL_TIMEOUT_SECONDS
+max_requests = _config.SERVER_MAX_REQUESTS
+max_requests_jitter = _config.SERVER_MAX_REQUESTS // 10
+pidfile = _config.SERVER_PIDFILE
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Database connections opened while preloading belong to the master;
+    # drop them from the worker's pools without closing the master's sockets
+    from app.models import db
+    with server.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -1,6 +1,7 @@
 from app import create_app
+from config import config_from_env
 
-app = create_app()
+app = create_app(config_from_env())
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""Run background jobs queued by the app (needs JOB_QUEUE_ASYNC=1 on the web side).
+
+    python worker.py --processes 2
+
+Each process polls the job table and runs one job at a time. SIGINT or
+SIGTERM lets the current jobs finish before the processes exit.
+"""
+import argparse
+import multiprocessing
+import signal
+import threading
+
+
+def run_worker():
+    from app import create_app
+    from app import jobs
+    from config import config_from_env
+
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+    app = create_app(config_from_env())
+    with app.app_context():
+        jobs.work(stop=stopping.is_set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+    if args.processes == 1:
+        run_worker()
+        return
+    # Create the app once first, so the workers don't race to set up a new database
+    from app import create_app
+    from config import config_from_env
+    create_app(config_from_env())
+    processes = [multiprocessing.Process(target=run_worker, name=f'qna-worker-{n}') for n in range(args.processes)]
+    for process in processes:
+        process.start()
+    # The children handle the signal themselves; the parent just waits for them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()